@@ -1,15 +1,44 @@
 import os
-import pandas as pd
-from sqlalchemy import create_engine
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import argparse
+from datetime import datetime
+from pyarrow import fs
+from athena_async import (AsyncAthenaClient, AdaptiveConcurrency, LandedQueue, DownloadAborted, aws_clients,
+                          download_devices, fetch_modes)
+from query_stats import check_pruning, summarize, append_run_log
 
 # Athena connection details
 region = 'us-east-1'
 s3_staging_dir = 's3://aws-athena-query-results-us-east-1-770418278010/query-results/'
 database = 'raw'
 
-# Create Athena engine
-engine = create_engine(f'awsathena+rest://@athena.{region}.amazonaws.com:443/{database}?s3_staging_dir={s3_staging_dir}')
+parser = argparse.ArgumentParser(description="Download one day of data for every device in devices_list.txt.")
+parser.add_argument("--only", nargs="+", metavar="DEVICE", help="Download only these devices, e.g. the failed ones of a previous run")
+parser.add_argument("--fake-source", help="Answer queries from <folder>/<device>.parquet with the local fake Athena")
+parser.add_argument("--fake-throttle-rate", type=float, default=0.0, help="Share of fake API calls that are throttled")
+parser.add_argument("--fake-failure-rate", type=float, default=0.0, help="Share of fake queries that fail with a retryable error")
+parser.add_argument("--fake-s3-folder", default="fake_s3", help="Local folder standing in for S3 with --fake-source")
+parser.add_argument("--fake-latency", type=float, default=1.0, help="Seconds a fake query stays running")
+parser.add_argument("--fetch-mode", choices=fetch_modes, default="csv",
+                    help="rows: GetQueryResults paging, csv: stream the result file from S3, unload: UNLOAD to parquet")
+parser.add_argument("--s3-endpoint", help="Endpoint of an S3-compatible store to read results from instead of AWS")
+parser.add_argument("--max-scan-mb", type=float, help="Warn when a device query scans more than this many MB")
+parser.add_argument("--max-concurrency", type=int, default=20, help="Upper bound for queries in flight")
+parser.add_argument("--landed-file", help="Append every device to this file as soon as its parquet file is saved")
+parser.add_argument("--processed-file", help="File the processing appends finished devices to (with --landed-file)")
+parser.add_argument("--max-unprocessed", type=int, default=4,
+                    help="Devices saved but not yet processed before further results wait (with --landed-file)")
+args = parser.parse_args()
+
+# Create the Athena client
+if args.fake_source:
+    from fake_athena import FakeAthenaClient
+    athena_client = FakeAthenaClient(args.fake_source, latency=args.fake_latency, throttle_rate=args.fake_throttle_rate,
+                                     failure_rate=args.fake_failure_rate, results_folder=args.fake_s3_folder)
+    os.makedirs(args.fake_s3_folder, exist_ok=True)
+    s3_filesystem = fs.SubTreeFileSystem(os.path.abspath(args.fake_s3_folder), fs.LocalFileSystem())
+else:
+    athena_client, s3_filesystem = aws_clients(region, args.s3_endpoint)
 
 # Read the date from the 'date' file
 try:
@@ -42,7 +71,7 @@ except Exception as e:
 
 # SQL query template with placeholders for year, month, day, cust_code, and device_name
 query_template = """
-SELECT value, name
+SELECT value, name, "timestamp"
 FROM raw."4sight_raw_sensors"
 WHERE 
     (substr(name, 1, 3) = 'CDL' OR substr(name, 1, 5) = 'J1939')
@@ -54,9 +83,13 @@ AND day = '{day}'
   
 """
 
-# Function to execute a query for a device and save the results
-def execute_device_query(device_name):
-    query = query_template.format(
+# Only the devices asked for on the command line, in devices_list.txt order
+if args.only:
+    device_names = [device for device in device_names if device in args.only]
+
+
+def build_device_query(device_name):
+    return query_template.format(
         device_name=device_name,
         cust_code=cust_code,
         year=year,
@@ -64,42 +97,43 @@ def execute_device_query(device_name):
         day=day
 
     )
-    try:
-        print(f"Executing query for {device_name} on {query_date}...")
-        df = pd.read_sql(query, engine)
-        
-        # Save results for each device
-        output_folder = 'parquet'
-        os.makedirs(output_folder, exist_ok=True)
-        file_path = os.path.join(output_folder, f"{device_name}.parquet")
-        df.to_parquet(file_path, index=False, compression='snappy')  # Added compression
-        print(f"Results for {device_name} saved to {file_path}")
-        return file_path
-    except Exception as e:
-        print(f"Error executing query for {device_name}: {e}")
-        return None
 
-# Execute queries in parallel for each device
-with ThreadPoolExecutor(max_workers=4) as executor:  # Adjust workers based on system capacity
-    futures = {executor.submit(execute_device_query, device): device for device in device_names}
-    
-    # Wait for all threads to complete and collect results
-    successes = []
-    failures = []
 
-    for future in futures:
-        device_name = futures[future]
-        try:
-            result = future.result()
-            if result:
-                successes.append(device_name)
-        except Exception as e:
-            failures.append(device_name)
-            print(f"Error with {device_name}: {e}")
+# Submit every device query at once; the limiter backs off while Athena throttles
+athena = AsyncAthenaClient(
+    athena_client, database, s3_staging_dir,
+    concurrency=AdaptiveConcurrency(initial=len(device_names), maximum=args.max_concurrency),
+)
+# Hand every saved device straight to the processing when it streams devices
+landed_queue = None
+if args.landed_file:
+    landed_queue = LandedQueue(args.landed_file, args.processed_file or "processed_devices.txt", args.max_unprocessed)
+print(f"Executing queries for {len(device_names)} devices on {query_date}...")
+try:
+    successes, failures, query_log = asyncio.run(download_devices(
+        athena, device_names, build_device_query, 'parquet', fetch_mode=args.fetch_mode, filesystem=s3_filesystem,
+        landed_queue=landed_queue,
+    ))
+except DownloadAborted as e:
+    print(f"❌ {e}")
+    exit(1)
+
+# Record what every query scanned and how long it queued, and flag queries that did not prune
+run_at = datetime.now().isoformat(timespec="seconds")
+for record in query_log:
+    record.update(run_at=run_at, cust_code=cust_code, query_date=query_date)
+max_scan_bytes = args.max_scan_mb * 1024 ** 2 if args.max_scan_mb else None
+for warning in check_pruning(query_log, max_scan_bytes=max_scan_bytes):
+    print(f"⚠️ Partition pruning: {warning}")
+failure_log = [{"run_at": run_at, "cust_code": cust_code, "query_date": query_date, "device": device, "error": error}
+               for device, error in failures.items()]
+append_run_log(query_log + failure_log)
 
 # Print summary of results
 print("\nSummary:")
+print(summarize(query_log))
 print(f"Successful queries: {len(successes)}")
 print(f"Failed queries: {len(failures)}")
 if failures:
-    print(f"Failed devices: {', '.join(failures)}")
\ No newline at end of file
+    print(f"Failed devices: {', '.join(failures)}")
+    print(f"Re-run only these with: python From_AWS.py --only {' '.join(failures)}")
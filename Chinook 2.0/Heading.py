@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+from reference_files import read_reference
 
 # File paths
 input_txt = "input_file.txt"
@@ -12,7 +13,7 @@ with open(input_txt, "r", encoding="utf-8") as file:
     search_term = file.readline().strip()  # Read first line and clean spaces
 
 # Load the Excel sheet
-df = pd.read_excel(vehicle_xlsx, sheet_name=0, engine="openpyxl", dtype=str)
+df = read_reference(vehicle_xlsx, sheet_name=0, engine="openpyxl", dtype=str)
 
 # Trim spaces from all cells but keep original case
 df = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
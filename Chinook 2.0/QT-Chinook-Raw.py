@@ -92,10 +92,9 @@ class ScriptRunnerApp(QWidget):
         self.setLayout(self.main_layout)
 
         # Initialize task-related attributes
-        self.first_script = "Kujbhi.py"
-        self.remaining_scripts = [
-            "raw.py",
-        ]
+        # raw_export.py exports every device of the client in one process
+        self.first_script = "raw_export.py"
+        self.remaining_scripts = []
 
         self.runner_thread = None
         self.selected_repetitions = 1
@@ -1,18 +1,23 @@
+import os
 import sys
 from datetime import datetime
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QGridLayout, QPushButton,
-    QLabel, QMessageBox, QProgressBar, QLineEdit, QGraphicsDropShadowEffect
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QPushButton, QLabel, QProgressBar,
+    QLineEdit, QGraphicsDropShadowEffect, QSpinBox, QTableWidget, QTableWidgetItem, QHeaderView
 )
 from PyQt5.QtCore import Qt
-from command_runner import CommandRunnerThread  # Import CommandRunnerThread
+from job_queue import JobQueue  # Import JobQueue
+from worker_service import default_address, start_service, stop_service
+
+# Most clients that can be processed at once; the worker service gets one more worker for a download
+max_parallel_clients = 3
 
 class ScriptRunnerApp(QWidget):
     def __init__(self):
         super().__init__()
 
         self.setWindowTitle("Chinook")
-        self.setGeometry(200, 200, 600, 400)
+        self.setGeometry(200, 200, 700, 600)
 
         # Main layout
         self.main_layout = QVBoxLayout()
@@ -87,10 +92,23 @@ class ScriptRunnerApp(QWidget):
 
         self.main_layout.addLayout(self.grid_layout)
 
-        # Progress bar
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setStyleSheet("height: 20px;")  # Increase height
-        self.main_layout.addWidget(self.progress_bar)
+        # Number of clients processed at the same time
+        self.parallel_layout = QHBoxLayout()
+        self.parallel_layout.addWidget(QLabel("Clients processed at once:"))
+        self.parallel_input = QSpinBox()
+        self.parallel_input.setRange(1, max_parallel_clients)
+        self.parallel_input.setValue(1)
+        self.parallel_layout.addWidget(self.parallel_input)
+        self.parallel_layout.addStretch()
+        self.main_layout.addLayout(self.parallel_layout)
+
+        # One status row per queued job
+        self.job_table = QTableWidget(0, 4)
+        self.job_table.setHorizontalHeaderLabels(["Client", "Date", "Status", "Progress"])
+        self.job_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.job_table.verticalHeader().setVisible(False)
+        self.job_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.main_layout.addWidget(self.job_table)
 
         self.setLayout(self.main_layout)
 
@@ -100,17 +118,28 @@ class ScriptRunnerApp(QWidget):
             "chinook.py",
             "Heading.py",
             "fmi.py",
+            "j1939_fmi.py",
             "j1939_stage1.py",
-            "j1939_stage2.py",
-            "j1939_stage3.py",
             "CDL_stage1.py",
-            "CDL_stage2.py",
-            "CDL_stage3.py",
+            "stats_engine.py",
+            "stuck_detector.py",
+            "gap_analysis.py",
             "one.py"
         ]
+        self.final_scripts = ["fleet_analysis.py", "regression_report.py"]
+
+        # Jobs run in their own folders under runs/; buttons only add jobs, so clicks are never blocked
+        self.job_queue = JobQueue(
+            self.first_script, self.remaining_scripts, self.final_scripts,
+            parallelism=self.parallel_input.value(), worker_address=default_address, stream_devices=True
+        )
+        self.job_queue.job_changed.connect(self.update_job_row)
+        self.job_queue.job_done.connect(self.task_complete)
+        self.job_queue.report_updated.connect(self.report_updated)
+        self.parallel_input.valueChanged.connect(self.job_queue.set_parallelism)
 
-        self.runner_thread = None
-        self.selected_repetitions = 1
+        # Warm worker service: libraries imported and reference files cached before the first click
+        self.worker_process = start_service(workers=max_parallel_clients + 1)
 
     def set_current_date(self):
         """Set the current date in the date input field and save it to date.txt."""
@@ -135,7 +164,7 @@ class ScriptRunnerApp(QWidget):
             return False
 
     def handle_file_action(self, task_name):
-        """Handle the selected task and update the date file."""
+        """Queue a job for the selected task with the entered date."""
         try:
             # Capture the current value of date_input
             date_text = self.date_input.text().strip()
@@ -150,58 +179,56 @@ class ScriptRunnerApp(QWidget):
             # Update the date.txt file with the entered date
             self.update_date_file(date_text)
 
-            # Get repetitions for the task
-            repetitions = self.task_repetitions.get(task_name, 1)
-            self.selected_repetitions = repetitions
-
-            # Update devices_list.txt with the content of the selected task's file
+            # The task's devices file must exist before the job is queued
             filename = f"{task_name}.txt"
-            with open(filename, "r") as input_file:
-                content = input_file.read()
-
-            with open("devices_list.txt", "w") as devices_file:
-                devices_file.write(content)
+            if not os.path.exists(filename):
+                raise FileNotFoundError(f"{filename} not found")
 
-            self.info_label.setText(f"{filename} content copied to devices_list.txt successfully!")
-            self.run_tasks()  # Run the sequence after handling the file
+            # Get repetitions for the task
+            repetitions = self.task_repetitions.get(task_name, 1)
+            self.add_job_row(task_name, date_text)
+            self.job_queue.enqueue(task_name, date_text, repetitions)
+            self.info_label.setText(f"{task_name} {date_text} queued.")
         except Exception as e:
             self.info_label.setText(f"Failed to handle {task_name}: {e}")
 
-    def toggle_ui(self, enable=True):
-        """Enable or disable the input and buttons during task execution."""
-        self.date_input.setEnabled(enable)
-        for i in range(self.grid_layout.count()):
-            widget = self.grid_layout.itemAt(i).widget()
-            if isinstance(widget, QPushButton):
-                widget.setEnabled(enable)
-
-    def run_tasks(self):
-        """Run the tasks using the runner thread."""
-        self.info_label.setText("Starting task execution...")
-        self.progress_bar.setValue(1)
-
-        # Disable the UI elements during task execution
-        self.toggle_ui(enable=False)
-
-        self.runner_thread = CommandRunnerThread(
-            self.first_script, self.remaining_scripts, self.selected_repetitions
-        )
-        self.runner_thread.progress.connect(self.update_status)
-        self.runner_thread.progress_bar_update.connect(self.progress_bar.setValue)
-        self.runner_thread.finished.connect(self.task_complete)
-        self.runner_thread.start()
-
-    def update_status(self, message):
-        """Update the info label with the progress message."""
-        self.info_label.setText(message)
-
-    def task_complete(self):
-        """Handle the task completion."""
-        self.info_label.setText("All tasks completed successfully!")
-        QMessageBox.information(self, "Success", "Report Files are ready in excel_outputs Folder")
-
-        # Re-enable the UI elements after task completion
-        self.toggle_ui(enable=True)
+    def add_job_row(self, task_name, date_text):
+        """Add the status row of a new job; rows are in the order of the queue's job numbers."""
+        row = self.job_table.rowCount()
+        self.job_table.insertRow(row)
+        self.job_table.setItem(row, 0, QTableWidgetItem(task_name))
+        self.job_table.setItem(row, 1, QTableWidgetItem(date_text))
+        self.job_table.setItem(row, 2, QTableWidgetItem("Queued"))
+        progress_bar = QProgressBar()
+        progress_bar.setValue(0)
+        self.job_table.setCellWidget(row, 3, progress_bar)
+
+    def update_job_row(self, row, message, percent):
+        """Show the latest status and progress of a job in its row."""
+        if row >= self.job_table.rowCount():
+            return
+        self.job_table.item(row, 2).setText(message)
+        self.job_table.cellWidget(row, 3).setValue(percent)
+
+    def report_updated(self, row, report_file, final):
+        """Point to the partial workbook, which grows by one device sheet at a time."""
+        if not final:
+            client = self.job_table.item(row, 0).text()
+            self.info_label.setText(f"{client} partial report: {report_file}")
+
+    def task_complete(self, row, report_file):
+        """Handle the completion of a job."""
+        client = self.job_table.item(row, 0).text()
+        if report_file:
+            self.info_label.setText(f"{client} report ready: {report_file}")
+        else:
+            self.info_label.setText(f"{client} finished; report files are in runs/{client}/excel_outputs")
+
+    def closeEvent(self, event):
+        """Stop the worker service the GUI started when the window closes."""
+        if self.worker_process is not None:
+            stop_service()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
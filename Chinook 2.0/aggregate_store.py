@@ -0,0 +1,266 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from section_spill import read_section
+
+# Root of the store; one file per client, day and device:
+# aggregate_store/client=<client>/date=<YYYY-MM-DD>/<device>.parquet
+store_folder = "aggregate_store"
+
+# Fault and out-of-range events of the day, in the same layout
+events_folder = "event_store"
+event_columns = ["device", "kind", "name", "code", "count"]
+
+# Stage outputs the events are collected from: kind -> workbooks in excel_outputs
+event_sources = {
+    "dtc": ["athena_query_results_dtc_J1939_with_count.xlsx", "athena_query_results_dtc_CDL_with_count.xlsx"],
+    "fault": ["FMI-CID.xlsx", "j1939_fault_codes.xlsx"],
+    "out_of_range": ["J1939_out_of_bounds.xlsx", "CDL_out_of_bounds.xlsx"],
+}
+
+# Centroids kept per tag in the quantile sketch
+sketch_size = 64
+
+# Percentiles reported when aggregates are merged
+percentiles = (5, 50, 95)
+
+
+def compress_centroids(points, keys, size=sketch_size):
+    """
+    Reduces weighted points to at most `size` equal-weight centroids per group.
+    Points with the same value are merged first, and a group with at most `size` distinct values
+    is kept exactly. Otherwise its points are sorted by value and cut into bins of equal
+    cumulative weight; each bin becomes one centroid (weighted mean, total weight). Histograms
+    and stored sketches are compressed the same way, so merging sketches is concatenating and
+    compressing again.
+    :param points: DataFrame with the key columns, 'mean' and 'weight'.
+    :param keys: Columns identifying a group, e.g. ['name'] or ['device', 'name'].
+    :return: DataFrame with the key columns, 'mean' and 'weight', sorted by keys and mean.
+    """
+    points = points[points["weight"] > 0].groupby(keys + ["mean"])["weight"].sum().reset_index()
+    grouped = points.groupby(keys, sort=False)["weight"]
+    before = grouped.cumsum() - points["weight"]
+    total = grouped.transform("sum")
+    equal_weight_bin = np.minimum((before / total * size).astype(int), size - 1)
+    exact = grouped.transform("size") <= size
+    points = points.assign(bin=np.where(exact, grouped.cumcount(), equal_weight_bin),
+                           weighted=points["mean"] * points["weight"])
+
+    centroids = points.groupby(keys + ["bin"], sort=False).agg(weighted=("weighted", "sum"), weight=("weight", "sum"))
+    centroids["mean"] = centroids["weighted"] / centroids["weight"]
+    return centroids.reset_index()[keys + ["mean", "weight"]]
+
+
+def histogram_aggregates(histogram_df, size=sketch_size):
+    """
+    Builds one aggregate row per tag from a (name, value, duplicate_count) histogram.
+    :return: (aggregates DataFrame with name, count, min, max, sum, sumsq;
+              centroids DataFrame with name, mean, weight)
+    """
+    points = pd.DataFrame({
+        "name": histogram_df["name"],
+        "mean": pd.to_numeric(histogram_df["value"], errors="coerce"),
+        "weight": pd.to_numeric(histogram_df["duplicate_count"], errors="coerce"),
+    }).dropna()
+    points = points[points["weight"] > 0]
+
+    weighted = points.assign(sum=points["mean"] * points["weight"],
+                             sumsq=points["mean"] ** 2 * points["weight"])
+    aggregates = weighted.groupby("name").agg(
+        count=("weight", "sum"),
+        min=("mean", "min"),
+        max=("mean", "max"),
+        sum=("sum", "sum"),
+        sumsq=("sumsq", "sum"),
+    ).reset_index()
+    return aggregates, compress_centroids(points, ["name"], size)
+
+
+def to_table(aggregates, centroids):
+    """
+    Packs the centroids of every tag into list columns next to its aggregate row.
+    Both frames are sorted by name (groupby and compress_centroids sort), so the centroids
+    of a tag are one contiguous slice.
+    """
+    lengths = centroids.groupby("name").size().reindex(aggregates["name"], fill_value=0).to_numpy()
+    offsets = pa.array(np.r_[0, np.cumsum(lengths)].astype(np.int32))
+    table = pa.Table.from_pandas(aggregates, preserve_index=False)
+    table = table.append_column("sketch_means", pa.ListArray.from_arrays(offsets, pa.array(centroids["mean"].to_numpy())))
+    return table.append_column("sketch_weights", pa.ListArray.from_arrays(offsets, pa.array(centroids["weight"].to_numpy())))
+
+
+def day_path(client, day, device, root=store_folder):
+    """Returns the store file of one client, day and device."""
+    return os.path.join(root, f"client={client}", f"date={day}", f"{device}.parquet")
+
+
+def run_identity(devices_list_file="devices_list.txt", date_file="date.txt", input_filename_file="input_file.txt"):
+    """Returns (client, day, device) of the device the stage chain is processing."""
+    with open(devices_list_file, "r") as f:
+        client = f.readline().strip()
+    with open(date_file, "r") as f:
+        day = f.readline().strip()
+    with open(input_filename_file, "r") as f:
+        device = os.path.splitext(f.read().strip())[0]
+    return client, day, device
+
+
+def save_device_day(client, day, device, histogram_dfs, root=store_folder):
+    """
+    Writes the aggregates of one device and day, replacing an earlier run of the same day.
+    :param histogram_dfs: (name, value, duplicate_count) histograms, e.g. of J1939 and CDL.
+    :return: Path of the written file.
+    """
+    histogram_df = pd.concat([df[["name", "value", "duplicate_count"]] for df in histogram_dfs], ignore_index=True)
+    aggregates, centroids = histogram_aggregates(histogram_df)
+    aggregates.insert(0, "device", device)
+    file_path = day_path(client, day, device, root)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    pq.write_table(to_table(aggregates, centroids), file_path, compression="zstd")
+    return file_path
+
+
+def device_events(folder="excel_outputs"):
+    """
+    Collects the day's events of one device from the stage outputs: DTC values, CDL fault
+    codes (CID/FMI), decoded J1939 fault codes (SPN/FMI) and tags with values outside their limits.
+    :return: DataFrame with kind, name, code and count.
+    """
+    frames = []
+    for kind, file_names in event_sources.items():
+        for file_name in file_names:
+            file_path = os.path.join(folder, file_name)
+            if not os.path.exists(file_path):
+                continue
+            df = read_section(file_path)
+            if df.empty or "name" not in df.columns:
+                continue
+            count = df["duplicate_count"] if "duplicate_count" in df.columns else df.get("count", 1)
+            if kind == "fault" and "spn" in df.columns:
+                code = "SPN " + df["spn"].astype(str) + " FMI " + df["fmi"].astype(str)
+            elif kind == "fault":
+                code = "CID " + df["cid"].astype(str) + " FMI " + df["fmi"].astype(str)
+            elif kind == "dtc":
+                code = df["value"].astype(str)
+            else:
+                code = ""
+            frames.append(pd.DataFrame({"kind": kind, "name": df["name"].astype(str), "code": code, "count": count}))
+    if not frames:
+        return pd.DataFrame(columns=event_columns[1:])
+    events = pd.concat(frames, ignore_index=True)
+    events["count"] = pd.to_numeric(events["count"], errors="coerce").fillna(1).astype("int64")
+    return events.groupby(["kind", "name", "code"], as_index=False)["count"].sum()
+
+
+def save_device_events(client, day, device, events, root=events_folder):
+    """Writes the events of one device and day next to its aggregates."""
+    events = events.assign(device=device)[event_columns]
+    file_path = day_path(client, day, device, root)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(events, preserve_index=False), file_path, compression="zstd")
+    return file_path
+
+
+def load_events(client, start_day, end_day, devices=None, root=events_folder):
+    """Reads the stored events of a client between two days (inclusive), with a 'date' column."""
+    client_folder = os.path.join(root, f"client={client}")
+    if not os.path.isdir(client_folder):
+        return pd.DataFrame(columns=event_columns + ["date"])
+    partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+    dataset = ds.dataset(client_folder, format="parquet", partitioning=partitioning)
+    condition = (ds.field("date") >= str(start_day)) & (ds.field("date") <= str(end_day))
+    if devices:
+        condition = condition & ds.field("device").isin(list(devices))
+    return dataset.to_table(filter=condition).to_pandas()
+
+
+def stored_days(client, root=store_folder):
+    """Returns the days with stored aggregates for a client, oldest first."""
+    client_folder = os.path.join(root, f"client={client}")
+    if not os.path.isdir(client_folder):
+        return []
+    return sorted(name[len("date="):] for name in os.listdir(client_folder) if name.startswith("date="))
+
+
+def load_aggregates(client, start_day, end_day, devices=None, tags=None, root=store_folder):
+    """
+    Reads the stored aggregates of a client between two days (inclusive).
+    Only the matching date folders are opened; device and tag filters are applied while scanning.
+    :return: (aggregates DataFrame with device, date, name, count, min, max, sum, sumsq;
+              centroids DataFrame with row, mean, weight, where row is the aggregates row number)
+    """
+    client_folder = os.path.join(root, f"client={client}")
+    if not os.path.isdir(client_folder):
+        return pd.DataFrame(columns=["device", "date", "name", "count", "min", "max", "sum", "sumsq"]), \
+            pd.DataFrame(columns=["row", "mean", "weight"])
+
+    partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+    dataset = ds.dataset(client_folder, format="parquet", partitioning=partitioning)
+    condition = (ds.field("date") >= str(start_day)) & (ds.field("date") <= str(end_day))
+    if devices:
+        condition = condition & ds.field("device").isin(list(devices))
+    if tags:
+        condition = condition & ds.field("name").isin(list(tags))
+    table = dataset.to_table(filter=condition)
+
+    means = table.column("sketch_means").combine_chunks()
+    weights = table.column("sketch_weights").combine_chunks()
+    centroids = pd.DataFrame({
+        "row": pc.list_parent_indices(means).to_numpy(),
+        "mean": pc.list_flatten(means).to_numpy(),
+        "weight": pc.list_flatten(weights).to_numpy(),
+    })
+    aggregates = table.drop_columns(["sketch_means", "sketch_weights"]).to_pandas()
+    return aggregates, centroids
+
+
+def merge_aggregates(aggregates, centroids, by=("name",)):
+    """
+    Merges stored aggregates into one row per group, e.g. per tag over a week or per device and tag.
+    Counts, sums and extremes add up exactly; percentiles come from the merged sketches.
+    :param by: Aggregate columns to group by.
+    :return: DataFrame with the group columns, count, min, max, mean, std and the percentiles.
+    """
+    by = list(by)
+    merged = aggregates.groupby(by).agg(count=("count", "sum"), min=("min", "min"), max=("max", "max"),
+                                        sum=("sum", "sum"), sumsq=("sumsq", "sum")).reset_index()
+    merged["mean"] = merged["sum"] / merged["count"]
+    merged["std"] = np.sqrt(np.maximum(merged["sumsq"] / merged["count"] - merged["mean"] ** 2, 0))
+
+    points = centroids.join(aggregates[by], on="row")
+    sketch = compress_centroids(points[by + ["mean", "weight"]], by)
+    cumulative = sketch.groupby(by, sort=False)["weight"].cumsum()
+    total = sketch.groupby(by, sort=False)["weight"].transform("sum")
+    for p in percentiles:
+        reached = sketch[cumulative >= total * p / 100].groupby(by, sort=False)["mean"].first()
+        merged = merged.merge(reached.rename(f"p{p:02d}").reset_index(), on=by, how="left")
+    return merged.drop(columns=["sum", "sumsq"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge stored daily aggregates into statistics over a period.")
+    parser.add_argument("client", help="Client code, e.g. mop")
+    parser.add_argument("start", help="First day (YYYY-MM-DD)")
+    parser.add_argument("end", help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--device", nargs="*", help="Only these devices")
+    parser.add_argument("--tag", nargs="*", help="Only these tags")
+    parser.add_argument("--by", nargs="+", default=["name"], choices=["name", "device", "date"],
+                        help="Columns to group by (default: name)")
+    parser.add_argument("--output", help="Write the result to this Excel file instead of printing it")
+    args = parser.parse_args()
+
+    aggregates, centroids = load_aggregates(args.client, args.start, args.end, args.device, args.tag)
+    if aggregates.empty:
+        print(f"No stored aggregates for {args.client} between {args.start} and {args.end}.")
+    else:
+        result = merge_aggregates(aggregates, centroids, by=args.by)
+        if args.output:
+            result.to_excel(args.output, index=False)
+            print(f"✅ {len(result)} rows saved to: {args.output}")
+        else:
+            print(result.to_string(index=False))
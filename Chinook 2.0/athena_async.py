@@ -0,0 +1,459 @@
+import os
+import time
+import uuid
+import asyncio
+import random
+import functools
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import boto3
+from pyarrow import fs
+from botocore.exceptions import ClientError
+
+from query_stats import execution_statistics
+
+# Error codes Athena returns when the account is over its request or query quota
+throttling_codes = {"ThrottlingException", "TooManyRequestsException", "TooManyRequests", "SlowDown"}
+# Error codes that are worth retrying as-is
+transient_codes = throttling_codes | {"InternalServerException", "ServiceUnavailable", "RequestTimeout"}
+
+# Athena result types that should not stay strings in the DataFrame
+numeric_types = {"tinyint", "smallint", "integer", "bigint", "float", "real", "double", "decimal"}
+
+# Arrow types for the Athena result types, used when reading the CSV result file directly
+arrow_types = {
+    "boolean": pa.bool_(),
+    "tinyint": pa.int8(),
+    "smallint": pa.int16(),
+    "integer": pa.int32(),
+    "bigint": pa.int64(),
+    "float": pa.float32(),
+    "real": pa.float32(),
+    "double": pa.float64(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("ms"),
+}
+
+# How results get from Athena to parquet/<device>.parquet:
+#   rows   - page through GetQueryResults (slow, row by row through the REST API)
+#   csv    - stream the CSV result file from the S3 staging dir as Arrow record batches
+#   unload - wrap the query in UNLOAD ... WITH (format = 'PARQUET') and stream the parquet files
+fetch_modes = ("rows", "csv", "unload")
+
+
+@functools.lru_cache(maxsize=None)
+def aws_clients(region, s3_endpoint=None):
+    """
+    Returns the boto3 Athena client and the Arrow S3 filesystem for a region, created once per
+    process, so a warm worker reuses their credentials and connection pools for every download.
+    """
+    return boto3.client("athena", region_name=region), fs.S3FileSystem(region=region, endpoint_override=s3_endpoint)
+
+
+def s3_path(uri):
+    """Turns s3://bucket/key into the bucket/key path pyarrow filesystems expect."""
+    return uri[len("s3://"):] if uri.startswith("s3://") else uri
+
+
+def unload_query(query, location):
+    """Wraps a SELECT in an UNLOAD that writes snappy parquet files to location."""
+    return f"UNLOAD ({query.strip()}) TO '{location}' WITH (format = 'PARQUET', compression = 'SNAPPY')"
+
+
+def write_batches(batches, schema, file_path):
+    """
+    Writes Arrow record batches to a snappy parquet file without going through pandas.
+    :return: Number of rows written.
+    """
+    rows = 0
+    with pq.ParquetWriter(file_path, schema, compression="snappy") as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def copy_csv_result(filesystem, output_location, schema, file_path):
+    """Streams a CSV result file from the staging dir into a parquet file."""
+    read_options = pa_csv.ReadOptions(block_size=16 << 20)
+    # Athena quotes every value and leaves NULLs as empty unquoted fields
+    convert_options = pa_csv.ConvertOptions(column_types=schema, strings_can_be_null=True,
+                                            quoted_strings_can_be_null=False)
+    with filesystem.open_input_stream(s3_path(output_location)) as stream:
+        reader = pa_csv.open_csv(stream, read_options=read_options, convert_options=convert_options)
+        return write_batches(reader, reader.schema, file_path)
+
+
+def copy_parquet_result(filesystem, location, file_path):
+    """Streams the parquet files an UNLOAD wrote into a single parquet file."""
+    dataset = ds.dataset(s3_path(location), format="parquet", filesystem=filesystem)
+    return write_batches(dataset.to_batches(), dataset.schema, file_path)
+
+
+class AthenaQueryError(Exception):
+    """A query that failed. transient is True when running it again may succeed."""
+
+    def __init__(self, message, transient=False, throttled=False):
+        super().__init__(message)
+        self.transient = transient
+        self.throttled = throttled
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the number of queries in flight. The limit is halved whenever Athena throttles
+    and grows back by one after a run of successful queries (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=20, increase_after=3):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase_after = increase_after
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record_success(self):
+        self._successes += 1
+        if self._successes >= self.increase_after and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+
+    def record_throttle(self):
+        self._successes = 0
+        new_limit = max(self.minimum, self.limit // 2)
+        if new_limit != self.limit:
+            print(f"Athena is throttling, lowering concurrency from {self.limit} to {new_limit}")
+        self.limit = new_limit
+
+
+def backoff_delay(attempt, base=1.0, maximum=30.0):
+    """Exponential backoff with jitter for the given (0-based) attempt."""
+    return min(maximum, base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+
+# Line the consumer appends to processed_file when it stops, so the download stops too
+aborted_marker = "#aborted"
+
+
+class DownloadAborted(Exception):
+    """The device processing stopped, or processed nothing for too long, so nothing more is saved."""
+
+
+class LandedQueue:
+    """
+    Bounded hand-off from the download to the device processing, through two text files so the
+    consumer can be another process: a device is appended to landed_file as soon as its parquet
+    file is written, and the consumer appends it to processed_file when its stages are done.
+    At most `limit` devices are landed but not processed; finished queries wait in S3 meanwhile.
+    The consumer stops the download by appending aborted_marker to processed_file.
+    """
+
+    def __init__(self, landed_file, processed_file, limit=4, poll_seconds=0.5, timeout=1800.0):
+        self.landed_file = landed_file
+        self.processed_file = processed_file
+        self.limit = limit
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+        self.reserved = 0
+        # Both files describe this run only
+        for file_path in (landed_file, processed_file):
+            open(file_path, "w").close()
+
+    def processed(self):
+        """
+        Number of processed devices.
+        :raises DownloadAborted: When the consumer has stopped.
+        """
+        with open(self.processed_file, "r") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        if aborted_marker in lines:
+            raise DownloadAborted("Device processing stopped; download aborted")
+        return len(lines)
+
+    async def reserve(self):
+        """
+        Waits for room for one more landed device and takes it.
+        :raises DownloadAborted: When the consumer stops, or processes nothing for `timeout` seconds.
+        """
+        deadline = time.monotonic() + self.timeout
+        processed = self.processed()
+        while self.reserved - processed >= self.limit:
+            if time.monotonic() > deadline:
+                raise DownloadAborted(f"No device processed for {self.timeout:.0f}s; download aborted")
+            await asyncio.sleep(self.poll_seconds)
+            current = self.processed()
+            if current != processed:
+                processed = current
+                deadline = time.monotonic() + self.timeout
+        self.reserved += 1
+
+    def release(self):
+        """Gives back a reservation whose device did not land."""
+        self.reserved -= 1
+
+    def landed(self, device_name):
+        with open(self.landed_file, "a") as f:
+            f.write(f"{device_name}\n")
+
+
+class AsyncAthenaClient:
+    """
+    Runs Athena queries from asyncio. The boto3-style client is called from worker threads,
+    so a real boto3 Athena client and the local fake in fake_athena.py both work.
+    """
+
+    def __init__(self, client, database, output_location, workgroup=None, concurrency=None,
+                 max_attempts=5, poll_interval=0.5, max_poll_interval=5.0, base_backoff=1.0):
+        """
+        :param client: boto3 Athena client (or a stand-in with the same methods).
+        :param database: Database the queries run in.
+        :param output_location: S3 staging dir for the query results.
+        :param workgroup: Optional Athena workgroup.
+        :param concurrency: AdaptiveConcurrency shared by all queries of the run.
+        :param max_attempts: Attempts per query before it counts as failed.
+        :param poll_interval: First delay between status polls, grows up to max_poll_interval.
+        :param base_backoff: Base delay in seconds for the retry backoff.
+        """
+        self.client = client
+        self.database = database
+        self.output_location = output_location
+        self.workgroup = workgroup
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.base_backoff = base_backoff
+
+    async def _call(self, method, **kwargs):
+        """Calls a client method in a thread, retrying throttled and transient API errors."""
+        for attempt in range(self.max_attempts):
+            try:
+                return await asyncio.to_thread(getattr(self.client, method), **kwargs)
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code", "")
+                if code not in transient_codes or attempt == self.max_attempts - 1:
+                    raise AthenaQueryError(f"{method} failed: {e}", transient=code in transient_codes,
+                                           throttled=code in throttling_codes) from e
+                if code in throttling_codes:
+                    self.concurrency.record_throttle()
+                await asyncio.sleep(backoff_delay(attempt, self.base_backoff))
+
+    async def start_query(self, query):
+        """Submits a query and returns its execution id."""
+        kwargs = {
+            "QueryString": query,
+            "QueryExecutionContext": {"Database": self.database},
+            "ResultConfiguration": {"OutputLocation": self.output_location},
+        }
+        if self.workgroup:
+            kwargs["WorkGroup"] = self.workgroup
+        response = await self._call("start_query_execution", **kwargs)
+        return response["QueryExecutionId"]
+
+    async def wait_for_query(self, execution_id):
+        """Polls a query until it finishes and returns its QueryExecution description."""
+        delay = self.poll_interval
+        while True:
+            response = await self._call("get_query_execution", QueryExecutionId=execution_id)
+            execution = response["QueryExecution"]
+            status = execution["Status"]
+            state = status["State"]
+            if state == "SUCCEEDED":
+                return execution
+            if state in ("FAILED", "CANCELLED"):
+                reason = status.get("StateChangeReason", state)
+                athena_error = status.get("AthenaError", {})
+                throttled = any(code in reason for code in throttling_codes) or "Rate exceeded" in reason
+                transient = throttled or athena_error.get("Retryable", False)
+                raise AthenaQueryError(f"Query {execution_id} {state.lower()}: {reason}",
+                                       transient=transient, throttled=throttled)
+            await asyncio.sleep(delay)
+            delay = min(self.max_poll_interval, delay * 1.5)
+
+    async def fetch_rows(self, execution_id):
+        """Pages through GetQueryResults and returns the result as a DataFrame."""
+        columns = None
+        types = None
+        rows = []
+        next_token = None
+        while True:
+            kwargs = {"QueryExecutionId": execution_id, "MaxResults": 1000}
+            if next_token:
+                kwargs["NextToken"] = next_token
+            response = await self._call("get_query_results", **kwargs)
+            result_set = response["ResultSet"]
+            page = [[field.get("VarCharValue") for field in row["Data"]] for row in result_set["Rows"]]
+            if columns is None:
+                column_info = result_set["ResultSetMetadata"]["ColumnInfo"]
+                columns = [column["Name"] for column in column_info]
+                types = [column["Type"].lower() for column in column_info]
+                page = page[1:]  # The first row of the first page repeats the column names
+            rows.extend(page)
+            next_token = response.get("NextToken")
+            if not next_token:
+                break
+
+        df = pd.DataFrame(rows, columns=columns)
+        for column, column_type in zip(columns, types):
+            if column_type in numeric_types:
+                df[column] = pd.to_numeric(df[column], errors="coerce")
+            elif column_type in ("date", "timestamp"):
+                df[column] = pd.to_datetime(df[column], errors="coerce")
+        return df
+
+    async def result_schema(self, execution_id):
+        """Reads the result column names and types and returns them as an Arrow schema."""
+        response = await self._call("get_query_results", QueryExecutionId=execution_id, MaxResults=1)
+        column_info = response["ResultSet"]["ResultSetMetadata"]["ColumnInfo"]
+        return pa.schema([(column["Name"], arrow_types.get(column["Type"].lower(), pa.string()))
+                          for column in column_info])
+
+    async def write_result(self, execution, file_path, fetch_mode="rows", filesystem=None, unload_location=None):
+        """
+        Saves a finished query's result to a parquet file.
+        :param execution: QueryExecution description returned by run_query.
+        :param file_path: Parquet file to write.
+        :param fetch_mode: One of fetch_modes.
+        :param filesystem: pyarrow filesystem the staging dir is read from (csv and unload modes).
+        :param unload_location: S3 prefix the UNLOAD wrote to (unload mode).
+        :return: Number of rows written.
+        """
+        execution_id = execution["QueryExecutionId"]
+        if fetch_mode == "rows":
+            df = await self.fetch_rows(execution_id)
+            await asyncio.to_thread(df.to_parquet, file_path, index=False, compression="snappy")
+            return len(df)
+        if fetch_mode == "csv":
+            schema = await self.result_schema(execution_id)
+            output_location = execution["ResultConfiguration"]["OutputLocation"]
+            return await asyncio.to_thread(copy_csv_result, filesystem, output_location, schema, file_path)
+        if fetch_mode == "unload":
+            return await asyncio.to_thread(copy_parquet_result, filesystem, unload_location, file_path)
+        raise ValueError(f"Unknown fetch mode {fetch_mode!r}, expected one of {fetch_modes}")
+
+    async def run_query(self, query):
+        """
+        Runs one query to completion under the shared concurrency limit, retrying transient failures.
+        :return: QueryExecution description of the successful run.
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                async with self.concurrency:
+                    execution_id = await self.start_query(query)
+                    execution = await self.wait_for_query(execution_id)
+                self.concurrency.record_success()
+                return execution
+            except AthenaQueryError as e:
+                if e.throttled:
+                    self.concurrency.record_throttle()
+                if not e.transient or attempt == self.max_attempts - 1:
+                    raise
+                delay = backoff_delay(attempt, self.base_backoff)
+                print(f"Retrying in {delay:.1f}s after transient failure: {e}")
+                await asyncio.sleep(delay)
+
+
+async def download_devices(athena, device_names, build_query, output_folder, fetch_mode="rows", filesystem=None,
+                           retry_rounds=1, round_cooldown=30.0, landed_queue=None):
+    """
+    Runs one query per device concurrently and saves each result to <output_folder>/<device>.parquet.
+    Devices that still fail after their own retries are re-fetched in up to retry_rounds
+    extra rounds, so only the failed devices are queried again.
+    :param athena: AsyncAthenaClient used for every query.
+    :param device_names: Devices to download.
+    :param build_query: Function device_name -> SQL text.
+    :param output_folder: Local folder for the parquet files.
+    :param fetch_mode: One of fetch_modes.
+    :param filesystem: pyarrow filesystem for the S3 staging dir (csv and unload modes).
+    :param landed_queue: LandedQueue every saved device is handed to, so processing starts before the
+                         other devices are in; results are only written while it has room.
+    :return: (list of successful devices, dictionary of failed device to error message,
+              list of query records with the execution statistics of every successful device)
+    """
+    if fetch_mode not in fetch_modes:
+        raise ValueError(f"Unknown fetch mode {fetch_mode!r}, expected one of {fetch_modes}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    # A device whose query fails today must not be processed with the file of an earlier run
+    for device_name in device_names:
+        stale_file = os.path.join(output_folder, f"{device_name}.parquet")
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+
+    async def fetch(device_name):
+        if landed_queue is not None:
+            landed_queue.processed()  # Raises once the processing has stopped
+        print(f"Executing query for {device_name}...")
+        query = build_query(device_name)
+        unload_location = None
+        if fetch_mode == "unload":
+            # UNLOAD needs an empty target prefix, so every attempt gets its own
+            unload_location = f"{athena.output_location}unload/{device_name}/{uuid.uuid4()}/"
+            query = unload_query(query, unload_location)
+        execution = await athena.run_query(query)
+        file_path = os.path.join(output_folder, f"{device_name}.parquet")
+        if landed_queue is not None:
+            await landed_queue.reserve()
+        fetch_start = time.perf_counter()
+        try:
+            rows = await athena.write_result(execution, file_path, fetch_mode, filesystem, unload_location)
+        except Exception:
+            if os.path.exists(file_path):
+                os.remove(file_path)  # Half-written results count as not downloaded
+            if landed_queue is not None:
+                landed_queue.release()
+            raise
+        print(f"Results for {device_name} saved to {file_path} ({rows} rows)")
+        if landed_queue is not None:
+            landed_queue.landed(device_name)
+        return {
+            "device": device_name,
+            "execution_id": execution["QueryExecutionId"],
+            "query": " ".join(query.split()),
+            "fetch_mode": fetch_mode,
+            "rows": rows,
+            "fetch_seconds": round(time.perf_counter() - fetch_start, 3),
+            **execution_statistics(execution),
+        }
+
+    successes = []
+    records = []
+    failures = {}
+    pending = list(device_names)
+    for round_index in range(retry_rounds + 1):
+        if round_index:
+            print(f"Re-fetching {len(pending)} failed devices in {round_cooldown:.0f}s...")
+            await asyncio.sleep(round_cooldown)
+        results = await asyncio.gather(*(fetch(device) for device in pending), return_exceptions=True)
+        aborted = [result for result in results if isinstance(result, DownloadAborted)]
+        if aborted:
+            raise aborted[0]
+        failures = {}
+        for device_name, result in zip(pending, results):
+            if isinstance(result, Exception):
+                failures[device_name] = str(result)
+                print(f"Error executing query for {device_name}: {result}")
+            else:
+                successes.append(device_name)
+                records.append(result)
+        pending = list(failures)
+        if not pending:
+            break
+    return successes, failures, records
@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+from synthetic_fleet import generate_fleet
+from parquet_reader import device_is_empty
+from workdirs import prepare_workdir
+
+# Folder the pipeline scripts live in; every run uses its own working folder
+script_folder = os.path.dirname(os.path.abspath(__file__))
+
+# Per-device stage chain, in the order QT-Chinook.py runs it
+device_scripts = [
+    "chinook.py",
+    "Heading.py",
+    "fmi.py",
+    "j1939_fmi.py",
+    "j1939_stage1.py",
+    "CDL_stage1.py",
+    "stats_engine.py",
+    "stuck_detector.py",
+    "gap_analysis.py",
+    "one.py",
+]
+
+# Client-wide scripts QT-Chinook.py runs once after the last device
+client_scripts = [
+    "fleet_analysis.py",
+    "regression_report.py",
+]
+
+
+def resolve_script(script):
+    """
+    Returns the path of a pipeline script. The GUI lists scripts with Windows'
+    case-insensitive names (j1939_stage2.py is J1939_stage2.py on disk), so match the same way.
+    """
+    for file_name in os.listdir(script_folder):
+        if file_name.lower() == script.lower():
+            return os.path.join(script_folder, file_name)
+    return os.path.join(script_folder, script)
+
+
+def run_script(workdir, script, args=(), log_file=None):
+    """
+    Runs one pipeline script inside workdir and returns the elapsed wall time in seconds.
+    """
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, resolve_script(script), *map(str, args)],
+        cwd=workdir, check=True, stdout=log_file or subprocess.DEVNULL, stderr=subprocess.STDOUT,
+    )
+    return time.perf_counter() - start
+
+
+def run_device_chain(workdir, device_count, scripts, log_file=None, final_scripts=()):
+    """
+    Runs input.py and the stage chain for every device, then the client-wide scripts once,
+    the way CommandRunnerThread does.
+    :return: Dictionary of script name to total seconds over all devices.
+    """
+    timings = {"input.py": 0.0}
+    timings.update({script: 0.0 for script in scripts})
+    with open(os.path.join(workdir, "devices_list.txt"), "r") as f:
+        lines = f.readlines()
+    for index in range(1, device_count + 1):
+        timings["input.py"] += run_script(workdir, "input.py", [index], log_file)
+        # Devices without data get the prebuilt empty section instead of the stages
+        device = lines[index].strip() if index < len(lines) else ""
+        if "one.py" in scripts and device_is_empty(os.path.join(workdir, "parquet", f"{device}.parquet")):
+            timings["empty_device.py"] = timings.get("empty_device.py", 0.0) + run_script(
+                workdir, "empty_device.py", scripts, log_file)
+            continue
+        for script in scripts:
+            timings[script] += run_script(workdir, script, log_file=log_file)
+    for script in final_scripts:
+        timings[script] = run_script(workdir, script, log_file=log_file)
+    return timings
+
+
+def git_commit():
+    """Returns the short commit hash of the checkout, or None outside a git repository."""
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=script_folder,
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(base_folder, scales, device_count, rows_per_day, query_date, cust_code="mop", seed=0,
+                  scripts=None, results_file="benchmark_results.jsonl"):
+    """
+    Generates a synthetic fleet for every scale, runs the stage chain on it and appends one
+    JSON record per scale to results_file.
+    :param base_folder: Folder that receives one working folder per scale.
+    :param scales: Volume multipliers, e.g. [1, 10, 100].
+    :param device_count: Number of devices in the fleet.
+    :param rows_per_day: Rows per device at scale 1.
+    :param query_date: Date written to date.txt (YYYY-MM-DD).
+    :param scripts: Stage chain to time, defaults to device_scripts.
+    :param results_file: JSON lines file the records are appended to.
+    :return: List of the records written.
+    """
+    scripts = scripts or device_scripts
+    records = []
+    for scale in scales:
+        workdir = os.path.join(base_folder, f"scale_{scale}")
+        shutil.rmtree(workdir, ignore_errors=True)
+        prepare_workdir(workdir, query_date)
+
+        print(f"Generating fleet at {scale}x ({device_count} devices, {rows_per_day * scale} rows each)...")
+        generate_fleet(workdir, cust_code, device_count, rows_per_day * scale, seed=seed,
+                       j1939_limits=os.path.join(workdir, "j1939_limit.xlsx"),
+                       cdl_limits=os.path.join(workdir, "CDL_limit.xlsx"), day=query_date)
+
+        print(f"Running stage chain at {scale}x...")
+        start = time.perf_counter()
+        with open(os.path.join(workdir, "benchmark.log"), "w") as log_file:
+            stages = run_device_chain(workdir, device_count, scripts, log_file, final_scripts=client_scripts)
+        end_to_end = time.perf_counter() - start
+
+        record = {
+            "run_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "scale": scale,
+            "devices": device_count,
+            "rows_per_device": rows_per_day * scale,
+            "stages": {script: round(seconds, 3) for script, seconds in stages.items()},
+            "end_to_end": round(end_to_end, 3),
+        }
+        records.append(record)
+        with open(results_file, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Scale {scale}x finished in {end_to_end:.1f}s")
+
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time every stage of the pipeline on synthetic fleets of increasing size.")
+    parser.add_argument("--base-folder", default="benchmark_runs", help="Folder for the per-scale working folders")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="Volume multipliers to run")
+    parser.add_argument("--devices", type=int, default=17, help="Number of devices in the fleet")
+    parser.add_argument("--rows-per-day", type=int, default=100000, help="Rows per device at scale 1")
+    parser.add_argument("--date", default="2025-01-13", help="Date written to date.txt")
+    parser.add_argument("--cust-code", default="mop", help="Client code for devices_list.txt")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generator")
+    parser.add_argument("--results", default="benchmark_results.jsonl", help="JSON lines file to append results to")
+    args = parser.parse_args()
+
+    run_benchmark(os.path.abspath(args.base_folder), args.scales, args.devices, args.rows_per_day, args.date,
+                  cust_code=args.cust_code, seed=args.seed, results_file=args.results)
@@ -1,5 +1,9 @@
 ﻿import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pair_counts import count_pairs, reduce_pairs
+from section_spill import write_section
 import re
 from sqlalchemy import create_engine
 from openpyxl import load_workbook
@@ -33,29 +37,34 @@ except Exception as e:
 
 input_path = os.path.join(input_folder, input_file)
 
-# Load input data from Parquet file
+# Function to remove illegal characters
+def remove_illegal_characters(value):
+    if isinstance(value, str):
+        return ''.join(c for c in value if c.isprintable())
+    return value
+
+# Load the (name, value) counts from the Parquet file: one compact table every bucket below slices from,
+# streamed in record batches so memory is bounded by the distinct (name, value) pairs
 try:
-    df = pd.read_parquet(input_path)
+    if 'name' not in pq.read_schema(input_path).names:
+        print("Error: 'name' column is missing from the DataFrame!")
+        sys.exit(1)
+    df = count_pairs(input_path).to_pandas()
     if df.empty:
         print("Input file is empty, proceeding to create files anyway.")
 except Exception as e:
     print(f"Error loading the input file: {e}")
     sys.exit(1)
 
-# Ensure 'name' column exists
-if 'name' not in df.columns:
-    print("Error: 'name' column is missing from the DataFrame!")
-    sys.exit(1)
-
-# Function to remove illegal characters
-def remove_illegal_characters(value):
-    if isinstance(value, str):
-        return ''.join(c for c in value if c.isprintable())
-    return value
-
-# Apply cleaning only to string columns
-for col in df.select_dtypes(include=['object']).columns:
-    df[col] = df[col].apply(remove_illegal_characters)
+# Apply cleaning only to string columns, once per distinct pair, and merge pairs that became equal
+cleaned = False
+for col in ['name', 'value']:
+    if df[col].dtype == object:
+        column = df[col].apply(remove_illegal_characters)
+        cleaned = cleaned or not column.equals(df[col])
+        df[col] = column
+if cleaned:
+    df = reduce_pairs(pa.Table.from_pandas(df, preserve_index=False), counts='duplicate_count').to_pandas()
 
 # Create output folder if it doesn't exist
 output_folder = 'excel_outputs'
@@ -89,13 +98,13 @@ def filter_and_save(df, filter_condition, output_filename, exclude_columns=None)
     print(f"Processing filter for {output_filename}...")
     try:
         filtered_df = df[filter_condition].copy()
-        print(f"Rows matching filter for {output_filename}: {len(filtered_df)}")
+        print(f"Rows matching filter for {output_filename}: {filtered_df['duplicate_count'].sum()}")
 
         # If no data matches, create a file with just headers
         if filtered_df.empty:
             print(f"No data to save for {output_filename}. Creating an empty file with headers.")
             filtered_df = pd.DataFrame(columns=['name', 'value', 'duplicate_count'])
-            filtered_df.to_excel(os.path.join(output_folder, output_filename), index=False)
+            write_section(filtered_df, os.path.join(output_folder, output_filename))
             apply_excel_formatting(os.path.join(output_folder, output_filename))
             print(f"✅ Successfully saved empty {output_filename}")
             return
@@ -103,16 +112,16 @@ def filter_and_save(df, filter_condition, output_filename, exclude_columns=None)
         if exclude_columns:
             filtered_df = filtered_df[~filtered_df['name'].str.contains('|'.join(exclude_columns), case=False, na=False)]
 
-        filtered_df['duplicate_count'] = filtered_df.groupby(['name', 'value'])['name'].transform('count')
-        filtered_unique = filtered_df.drop_duplicates(subset=['name', 'value'])
-        filtered_unique = filtered_unique[['name', 'value', 'duplicate_count']]
+        # df already holds one row per (name, value) with its count
+        filtered_unique = filtered_df[['name', 'value', 'duplicate_count']]
         filtered_unique = filtered_unique.sort_values(by='name', ascending=True)
 
         for col in filtered_unique.select_dtypes(include=['object']).columns:
             filtered_unique[col] = filtered_unique[col].apply(remove_illegal_characters)
 
         output_file_path = os.path.join(output_folder, output_filename)
-        filtered_unique.to_excel(output_file_path, index=False)
+        # Sections beyond the row limit keep every row in a companion parquet file
+        write_section(filtered_unique, output_file_path)
         apply_excel_formatting(output_file_path)
         print(f"✅ Successfully saved {output_filename}")
     except Exception as e:
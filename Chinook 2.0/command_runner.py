@@ -1,53 +1,326 @@
+import os
 import sys
+import shutil
+import threading
 import subprocess
+from contextlib import contextmanager
 from PyQt5.QtCore import QThread, pyqtSignal
 import time
+from worker_service import WorkerClient, script_path
+from stage_timings import StageClock, timings_file
+from parquet_reader import device_is_empty
+
+# Hand-off files between a streaming download and the device processing (see athena_async.LandedQueue)
+landed_file = "landed_devices.txt"
+processed_file = "processed_devices.txt"
+landed_limit = 4  # Devices downloaded ahead of the processing at most
+aborted_marker = "#aborted"  # Appended to processed_file on failure; athena_async.LandedQueue then stops the download
+landed_poll_seconds = 0.5
 
 class CommandRunnerThread(QThread):
     progress = pyqtSignal(str)
     progress_bar_update = pyqtSignal(int)  # Signal to update the progress bar
     finished = pyqtSignal()  # Signal emitted when all tasks are complete
+    failed = pyqtSignal(str)  # Signal emitted with the error when a script fails
+    # Emitted when a stage starts: dict with device, device_number, device_count, stage, stage_number,
+    # stage_count, percent and eta_seconds (device is None for the download and the client-wide stages)
+    stage_started = pyqtSignal(dict)
+    report_updated = pyqtSignal(str, bool)  # Path of the delivered client workbook, whether it is final
 
-    def __init__(self, first_script, remaining_scripts, repetitions):
+    def __init__(self, first_script, remaining_scripts, repetitions, final_scripts=None, worker_address=None,
+                 workdir=None, download_slot=None, processing_slot=None, stream_devices=False,
+                 report_folder=None, timings_path=timings_file):
         super().__init__()
         self.first_script = first_script
         self.remaining_scripts = remaining_scripts
         self.repetitions = repetitions
+        self.final_scripts = final_scripts or []  # Run once after every device, e.g. fleet-wide stages
+        self.worker_address = worker_address  # Warm worker service to run the scripts in, None for new interpreters
+        self.worker = None
+        self.workdir = workdir  # Folder the scripts run in, None for the current folder
+        # Shared slots (context managers) held while downloading and while processing the devices,
+        # so a job queue can bound how many runners do each at once
+        self.download_slot = download_slot
+        self.processing_slot = processing_slot
+        # Process every device as soon as the first script (From_AWS.py) has saved it, while the
+        # other devices are still downloading
+        self.stream_devices = stream_devices
+        # Folder the client workbook is copied to after every device (as <name>_partial.xlsx) and at the end
+        self.report_folder = report_folder
+        self.report_file = None
         self.input_parameter = 1  # Initial parameter for input.py
+        # Progress and ETA are measured in expected seconds, learned from the stage timings of earlier runs
+        self.clock = StageClock(timings_path)
+        self.total_weight = 1.0
+        self.remaining_weight = 1.0
+        self.device_names = {}
+        self.device_count = 0
+        self.devices_done = 0
+
+    def run_script(self, script, args=(), worker=None):
+        """Runs one script through the warm worker service when there is one, else in a new interpreter."""
+        worker = worker if worker is not None else self.worker
+        if worker is not None:
+            seconds = worker.run(script, args, cwd=self.workdir)
+        else:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script_path(script), *map(str, args)], cwd=self.workdir, check=True)
+            seconds = time.perf_counter() - start
+        self.clock.record(script, seconds)
+
+    def work_file(self, file_name):
+        return os.path.join(self.workdir or os.getcwd(), file_name)
+
+    @contextmanager
+    def holding(self, slot, name):
+        """Holds a shared slot for the enclosed stage, waiting for one to be free."""
+        if slot is None:
+            yield
+            return
+        self.progress.emit(f"Waiting for a {name} slot...")
+        with slot:
+            yield
+
+    def plan(self, device_count, download_overlaps=False):
+        """Sets the expected seconds of the whole run, from which progress and ETA are measured."""
+        self.device_count = device_count
+        device_weight = sum(self.clock.expect(script) for script in ["input.py"] + self.remaining_scripts)
+        final_weight = sum(self.clock.expect(script) for script in self.final_scripts)
+        # A streamed download runs alongside the processing and only delays the first device
+        download_weight = self.clock.expect(self.first_script) / (max(device_count, 1) if download_overlaps else 1)
+        self.total_weight = max(download_weight + device_count * device_weight + final_weight, 1e-6)
+        self.remaining_weight = self.total_weight
+        self.download_weight = download_weight
+
+    def stage_event(self, stage, stage_number, stage_count, input_parameter=None):
+        """Emits the start of a stage with the run's progress and ETA."""
+        percent = int(100 * (1 - self.remaining_weight / self.total_weight))
+        self.stage_started.emit({
+            "device": self.device_names.get(input_parameter) if input_parameter is not None else None,
+            "device_number": self.devices_done + 1 if input_parameter is not None else None,
+            "device_count": self.device_count,
+            "stage": stage,
+            "stage_number": stage_number,
+            "stage_count": stage_count,
+            "percent": percent,
+            "eta_seconds": self.remaining_weight * self.clock.speed(),
+        })
+
+    def task_done(self, script, weight=None):
+        self.remaining_weight = max(self.remaining_weight - (self.clock.expect(script) if weight is None else weight), 0)
+        self.progress_bar_update.emit(int(100 * (1 - self.remaining_weight / self.total_weight)))
+
+    def device_without_data(self, input_parameter):
+        """True when the device's parquet file is missing or has no rows and one.py builds its report."""
+        device = self.device_names.get(input_parameter)
+        if device is None or "one.py" not in self.remaining_scripts:
+            return False
+        return device_is_empty(self.work_file(os.path.join("parquet", f"{device}.parquet")))
+
+    def process_device(self, input_parameter):
+        """Runs input.py with the device's line number in devices_list.txt, then every per-device script."""
+        scripts = ["input.py"] + self.remaining_scripts
+        if self.device_without_data(input_parameter):
+            # Offline device or failed download: write the prebuilt empty section instead of every stage
+            self.stage_event("empty_device.py", 2, 2, input_parameter)
+            self.progress.emit(f"Running input.py {input_parameter}...")
+            self.run_script("input.py", [input_parameter])
+            self.progress.emit(f"{self.device_names[input_parameter]} has no data, writing its empty section...")
+            self.run_script("empty_device.py", self.remaining_scripts)
+            self.task_done(None, weight=sum(self.clock.expect(script) for script in scripts))
+            self.devices_done += 1
+            self.deliver_report(final=False)
+            return
+        for stage_number, script in enumerate(scripts, start=1):
+            self.stage_event(script, stage_number, len(scripts), input_parameter)
+            if script == "input.py":
+                self.progress.emit(f"Running input.py {input_parameter}...")
+                self.run_script("input.py", [input_parameter])
+            else:
+                self.progress.emit(f"Running {script}...")
+                self.run_script(script)
+            self.task_done(script)
+        self.devices_done += 1
+        self.deliver_report(final=False)
+
+    def run_final_scripts(self):
+        # Run the client-wide scripts once all devices are done
+        for stage_number, script in enumerate(self.final_scripts, start=1):
+            self.stage_event(script, stage_number, len(self.final_scripts))
+            self.progress.emit(f"Running {script}...")
+            self.run_script(script)
+            self.task_done(script)
+
+    def client_workbook(self):
+        """Name one.py gives the client workbook: first line of devices_list.txt and the date."""
+        with open(self.work_file("devices_list.txt"), "r") as f:
+            client_code = f.readline().strip()
+        with open(self.work_file("date.txt"), "r") as f:
+            query_date = f.readline().strip()
+        return f"{client_code}_{query_date.replace('-', '')}.xlsx"
+
+    def deliver_report(self, final):
+        """
+        Copies the client workbook, with the sheets of the devices done so far, to the report folder:
+        as <name>_partial.xlsx after every device, so triage can start early, and as <name> at the end.
+        A copy open in Excel is left alone with a warning.
+        """
+        if self.report_folder is None:
+            return
+        try:
+            file_name = self.client_workbook()
+            source = self.work_file(os.path.join("Surprise", file_name))
+            if not os.path.exists(source):
+                return
+            os.makedirs(self.report_folder, exist_ok=True)
+            partial_file = os.path.join(self.report_folder, file_name.replace(".xlsx", "_partial.xlsx"))
+            target = os.path.join(self.report_folder, file_name) if final else partial_file
+            # Copy beside the target first, so a reader never opens a half-written workbook
+            shutil.copy2(source, f"{target}.tmp")
+            os.replace(f"{target}.tmp", target)
+            # Full rows of the sections over the row limit, linked from the workbook
+            overflow_folder = os.path.splitext(source)[0] + "_overflow"
+            if os.path.isdir(overflow_folder):
+                shutil.copytree(overflow_folder, os.path.join(self.report_folder, os.path.basename(overflow_folder)),
+                                dirs_exist_ok=True)
+            if final and os.path.exists(partial_file):
+                os.remove(partial_file)
+            self.report_file = target
+            self.report_updated.emit(target, final)
+        except OSError as e:
+            self.progress.emit(f"⚠️ Could not update the report in {self.report_folder}: {e}")
 
     def run(self):
         try:
-            total_tasks = 1 + (len(self.remaining_scripts) * self.repetitions) + self.repetitions
-            completed_tasks = 0
+            if self.worker_address is not None:
+                self.worker = WorkerClient(self.worker_address)
+
+            if self.stream_devices and self.remaining_scripts:
+                self.run_streaming()
+            else:
+                self.run_in_order()
 
-            # Run the first script once
+            self.deliver_report(final=True)
+
+            # All tasks completed
+            self.progress_bar_update.emit(100)
+            self.progress.emit("All tasks completed successfully!")
+            self.finished.emit()  # Notify completion
+
+        except Exception as e:  # Any error must end the job, or its row and slot stay taken
+            self.progress.emit(f"Error: {e}")
+            self.failed.emit(f"Error: {e}")
+        finally:
+            if self.worker is not None:
+                self.worker.close()
+            try:
+                self.clock.save()
+            except OSError as e:
+                self.progress.emit(f"⚠️ Could not save the stage timings: {e}")
+
+    def run_in_order(self):
+        """Downloads every device, then processes the devices one after the other."""
+        # Without per-device scripts the first script does all the work
+        repetitions = self.repetitions if self.remaining_scripts else 0
+        self.plan(repetitions)
+        try:
+            self.device_names = {number: device for device, number in self.device_lines().items()}
+        except OSError:
+            pass  # input.py reports the missing list
+
+        # Run the first script once
+        with self.holding(self.download_slot, "download"):
+            self.stage_event(self.first_script, 1, 1)
             self.progress.emit(f"Downloading {self.first_script}...")
-            subprocess.run([sys.executable, self.first_script], check=True)
-            completed_tasks += 1
-            self.progress_bar_update.emit(int((completed_tasks / total_tasks) * 100))
+            self.run_script(self.first_script)
+        self.task_done(self.first_script)
 
+        with self.holding(self.processing_slot, "processing"):
             # Run the remaining scripts multiple times
-            for i in range(self.repetitions):  # Run scripts 'repetitions' times
-                # Run input.py with the current parameter
-                self.progress.emit(f"Running input.py {self.input_parameter}...")
-                time.sleep(1)
-                subprocess.run([sys.executable, "input.py", str(self.input_parameter)], check=True)
-                completed_tasks += 1
-                self.progress_bar_update.emit(int((completed_tasks / total_tasks) * 100))
+            for i in range(repetitions):  # Run scripts 'repetitions' times
+                self.process_device(self.input_parameter)
 
                 # Increment the input parameter for the next repetition
                 self.input_parameter += 1
 
-                # Run all remaining scripts
-                for script in self.remaining_scripts:
-                    self.progress.emit(f"Running {script}...")
-                    subprocess.run([sys.executable, script], check=True)
-                    completed_tasks += 1
-                    self.progress_bar_update.emit(int((completed_tasks / total_tasks) * 100))
+            self.run_final_scripts()
 
-            # All tasks completed
-            self.progress.emit("All tasks completed successfully!")
-            self.finished.emit()  # Notify completion
+    def device_lines(self):
+        """Maps every device of devices_list.txt to its line number, the parameter input.py takes."""
+        with open(self.work_file("devices_list.txt"), "r") as f:
+            lines = f.readlines()
+        positions = {}
+        for number, line in enumerate(lines[1:], start=1):
+            if line.strip():
+                positions.setdefault(line.strip(), number)
+        return positions
+
+    def run_streaming(self):
+        """
+        Producer/consumer run: the first script downloads in a background thread and appends every
+        saved device to landed_file; this thread processes the landed devices in landing order and
+        appends them to processed_file, which lets the download save further devices. The client-wide
+        scripts run when the download is over and every landed device is processed.
+        """
+        positions = self.device_lines()
+        self.device_names = {number: device for device, number in positions.items()}
+        self.plan(len(positions), download_overlaps=True)
+        for file_name in (landed_file, processed_file):
+            open(self.work_file(file_name), "w").close()
 
-        except subprocess.CalledProcessError as e:
-            self.progress.emit(f"Error: {e}")
\ No newline at end of file
+        errors = []
+        download = threading.Thread(target=self.download_streaming, args=(errors,), daemon=True)
+        download.start()
+
+        processed = set()
+        try:
+            while True:
+                download_over = not download.is_alive()
+                with open(self.work_file(landed_file), "r") as f:
+                    landed = [line.strip() for line in f if line.strip() and line.strip() not in processed]
+                for device in landed:
+                    processed.add(device)
+                    if device in positions:
+                        with self.holding(self.processing_slot, "processing"):
+                            self.process_device(positions[device])
+                    with open(self.work_file(processed_file), "a") as f:
+                        f.write(f"{device}\n")
+                if download_over and not landed:
+                    break
+                if not landed:
+                    time.sleep(landed_poll_seconds)
+        except BaseException:
+            # Stop the download too, so it does not wait for room forever holding its slot and worker
+            with open(self.work_file(processed_file), "a") as f:
+                f.write(f"{aborted_marker}\n")
+            download.join()
+            raise
+
+        download.join()
+        if errors:
+            raise errors[0]
+        # Devices whose download failed still get their (empty) section
+        missing = [device for device in positions if device not in processed]
+        if missing:
+            self.progress.emit(f"Not downloaded: {', '.join(missing)}")
+            with self.holding(self.processing_slot, "processing"):
+                for device in missing:
+                    self.process_device(positions[device])
+        with self.holding(self.processing_slot, "processing"):
+            self.run_final_scripts()
+
+    def download_streaming(self, errors):
+        """Runs the first script with the hand-off files, on its own worker connection."""
+        worker = WorkerClient(self.worker_address) if self.worker_address is not None else None
+        try:
+            with self.holding(self.download_slot, "download"):
+                self.stage_event(self.first_script, 1, 1)
+                self.progress.emit(f"Downloading {self.first_script}...")
+                self.run_script(self.first_script, ["--landed-file", landed_file, "--processed-file", processed_file,
+                                                    "--max-unprocessed", landed_limit], worker=worker)
+            self.task_done(self.first_script, weight=self.download_weight)
+        except Exception as e:  # Reported by run_streaming, which must not take a failed download for offline devices
+            errors.append(e)
+        finally:
+            if worker is not None:
+                worker.close()
@@ -0,0 +1,118 @@
+import os
+import hashlib
+import argparse
+import tempfile
+from copy import copy
+import openpyxl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import one
+from workdirs import prepare_workdir, reference_files
+from worker_service import run_script, script_folder
+
+# Empty device sections built so far, one workbook per version of the stage scripts and limits
+sections_folder = "empty_sections"
+
+# Device the section is built for: its sheet name is E000000 and it has no vehicle details
+placeholder_device = "symbotE000000"
+
+heading_file = "excel_outputs/Heading.xlsx"
+
+# Columns of a device file as From_AWS.py saves it
+device_schema = pa.schema([("value", pa.string()), ("name", pa.string()), ("timestamp", pa.timestamp("ms"))])
+
+
+def section_key(scripts):
+    """
+    Identifies what the empty section depends on: the stage scripts, the modules they import and
+    the reference workbooks. Any change gives a new key, so a stale section is never used.
+    """
+    digest = hashlib.sha1("\n".join(scripts).encode())
+    code_files = sorted(os.path.join(script_folder, name) for name in os.listdir(script_folder) if name.endswith(".py"))
+    for file_path in code_files + reference_files:
+        if os.path.exists(file_path):
+            stat = os.stat(file_path)
+            digest.update(f"{file_path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    return digest.hexdigest()[:12]
+
+
+def build_section(scripts, section_file):
+    """
+    Runs the stage scripts once on a device file without rows, in a scratch folder, and keeps the
+    device sheet one.py wrote (without vehicle details, the only part that differs per device).
+    """
+    with open("date.txt", "r") as f:
+        query_date = f.readline().strip()
+    with open("devices_list.txt", "r") as f:
+        client_code = f.readline().strip()
+
+    print(f"Building the empty device section for {len(scripts)} scripts...")
+    with tempfile.TemporaryDirectory(dir=".") as folder:
+        folder = os.path.abspath(folder)
+        prepare_workdir(folder, query_date)
+        os.makedirs(os.path.join(folder, "parquet"))
+        pq.write_table(device_schema.empty_table(), os.path.join(folder, "parquet", f"{placeholder_device}.parquet"))
+        with open(os.path.join(folder, "devices_list.txt"), "w") as f:
+            f.write(f"{client_code}\n{placeholder_device}\n")
+
+        for script, args in [("input.py", [1])] + [(script, []) for script in scripts]:
+            code, _ = run_script(script, args, cwd=folder)
+            if code != 0:
+                raise RuntimeError(f"{script} failed on an empty device (exit code {code})")
+
+        workbook_file = os.path.join(folder, "Surprise", f"{client_code}_{query_date.replace('-', '')}.xlsx")
+        wb = openpyxl.load_workbook(workbook_file)
+        for sheet_name in wb.sheetnames:
+            if sheet_name != placeholder_device[6:13]:
+                wb.remove(wb[sheet_name])
+        os.makedirs(os.path.dirname(section_file), exist_ok=True)
+        wb.save(f"{section_file}.tmp")
+    os.replace(f"{section_file}.tmp", section_file)
+
+
+def write_section(section_file, output_file, sheet_name, spacing=5):
+    """
+    Writes an empty device's sheet into the client workbook: the vehicle details the way one.py
+    writes them, followed by the prebuilt section rows with their fills and fonts.
+    """
+    one.copy_and_paste_excel(["Heading.xlsx"], ["SYMX-AI"], sheet_name, output_file, spacing=spacing)
+
+    wb = openpyxl.load_workbook(output_file)
+    dest_sheet = wb[sheet_name]
+    if dest_sheet.max_row == 1 and dest_sheet.cell(1, 1).value is None:
+        start_row = 1
+    else:
+        start_row = dest_sheet.max_row + spacing
+    section_sheet = openpyxl.load_workbook(section_file).active
+    for row in section_sheet.iter_rows():
+        for cell in row:
+            if cell.value is None and not cell.has_style:
+                continue
+            target = dest_sheet.cell(row=start_row + cell.row - 1, column=cell.column, value=cell.value)
+            if cell.has_style:
+                target.fill = copy(cell.fill)
+                target.font = copy(cell.font)
+    wb.save(output_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the report section of a device without data, skipping the stage scripts.")
+    parser.add_argument("scripts", nargs="+", help="Per-device stage scripts the section stands in for, in order")
+    args = parser.parse_args()
+
+    # Step 1: The prebuilt section for these scripts and limits, built on first use
+    section_file = os.path.join(sections_folder, f"empty_section_{section_key(args.scripts)}.xlsx")
+    if not os.path.exists(section_file):
+        build_section(args.scripts, section_file)
+
+    # Step 2: Vehicle details of the device; Heading.py leaves the previous device's file when it finds none
+    if "Heading.py" in args.scripts:
+        if os.path.exists(heading_file):
+            os.remove(heading_file)
+        run_script("Heading.py")
+
+    # Step 3: The device sheet in the client workbook
+    output_sheet_name = one.extract_output_sheet_name("input_file.txt")
+    output_file, one.device_name, one.formatted_date = one.get_output_file_name("devices_list.txt", "date.txt")
+    write_section(section_file, output_file, output_sheet_name)
+    print(f"✅ Empty device section written to sheet {output_sheet_name} of {output_file}")
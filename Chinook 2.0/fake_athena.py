@@ -0,0 +1,176 @@
+import os
+import re
+import time
+import uuid
+import random
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+
+def client_error(code, message, operation):
+    """Builds the botocore ClientError a real Athena client raises."""
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def athena_type(column):
+    """Athena type name reported for a result column."""
+    return "timestamp" if pd.api.types.is_datetime64_any_dtype(column) else "varchar"
+
+
+class FakeAthenaClient:
+    """
+    Local stand-in for the boto3 Athena client, for exercising From_AWS.py without AWS.
+    Device queries are answered from <source_folder>/<device>.parquet (e.g. the output of
+    synthetic_fleet.py). Latency, API throttling and transient query failures can be injected.
+    With a results_folder, result files are also written the way Athena writes them to the
+    S3 staging dir (a quoted CSV per query, parquet files for UNLOAD), with s3://bucket/key
+    mapped to <results_folder>/bucket/key.
+    """
+
+    def __init__(self, source_folder, latency=1.0, max_running=5, throttle_rate=0.0,
+                 failure_rate=0.0, page_size=1000, results_folder=None, seed=None):
+        """
+        :param source_folder: Folder with one <device>.parquet file per device.
+        :param latency: Seconds a query stays RUNNING.
+        :param max_running: Queries allowed to run at once; more submissions are throttled.
+        :param throttle_rate: Share of API calls rejected with ThrottlingException.
+        :param failure_rate: Share of queries that end FAILED with a retryable error.
+        :param page_size: Upper bound for rows per GetQueryResults page.
+        :param results_folder: Local folder standing in for S3.
+        """
+        self.source_folder = source_folder
+        self.latency = latency
+        self.max_running = max_running
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.page_size = page_size
+        self.results_folder = results_folder
+        self.random = random.Random(seed)
+        self.executions = {}
+        self.calls = {"start_query_execution": 0, "get_query_execution": 0, "get_query_results": 0}
+        self.lock = threading.Lock()
+
+    def _maybe_throttle(self, operation):
+        with self.lock:
+            self.calls[operation] += 1
+            throttled = self.random.random() < self.throttle_rate
+        if throttled:
+            raise client_error("ThrottlingException", "Rate exceeded", operation)
+
+    def _running(self):
+        now = time.monotonic()
+        return sum(1 for e in self.executions.values() if now < e["finishes_at"])
+
+    def start_query_execution(self, QueryString, QueryExecutionContext=None, ResultConfiguration=None,
+                              WorkGroup=None):
+        self._maybe_throttle("start_query_execution")
+        with self.lock:
+            if self._running() >= self.max_running:
+                raise client_error("TooManyRequestsException", "Too many queries running", "StartQueryExecution")
+            execution_id = str(uuid.uuid4())
+            self.executions[execution_id] = {
+                "query": QueryString,
+                "output_location": (ResultConfiguration or {}).get("OutputLocation", ""),
+                "submitted_at": time.monotonic(),
+                "finishes_at": time.monotonic() + self.latency,
+                "fails": self.random.random() < self.failure_rate,
+                "result": None,
+            }
+        if self.results_folder:
+            self._write_result_files(execution_id, self.executions[execution_id])
+        return {"QueryExecutionId": execution_id}
+
+    def _local_path(self, uri):
+        return os.path.join(self.results_folder, uri[len("s3://"):] if uri.startswith("s3://") else uri)
+
+    def _write_result_files(self, execution_id, execution):
+        """Writes the result where Athena would: the UNLOAD target or <OutputLocation><id>.csv."""
+        table = pa.Table.from_pandas(self._result(execution), preserve_index=False)
+        unload = re.search(r"^\s*UNLOAD\s*\(.*\)\s*TO\s*'([^']+)'", execution["query"], re.S)
+        if unload:
+            folder = self._local_path(unload.group(1))
+            os.makedirs(folder, exist_ok=True)
+            pq.write_table(table, os.path.join(folder, f"{execution_id}_00000.parquet"), compression="snappy")
+            table = table.slice(0, 0)  # UNLOAD returns no rows itself
+        file_path = self._local_path(f"{execution['output_location']}{execution_id}.csv")
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        pa_csv.write_csv(table, file_path, pa_csv.WriteOptions(quoting_style="all_valid"))
+
+    def _result(self, execution):
+        """Loads the rows the query asks for, once per execution."""
+        if execution["result"] is None:
+            match = re.search(r"device IN \('([^']+)'\)", execution["query"])
+            file_path = os.path.join(self.source_folder, f"{match.group(1)}.parquet") if match else None
+            if file_path and os.path.exists(file_path):
+                execution["result"] = pd.read_parquet(file_path)
+            else:
+                execution["result"] = pd.DataFrame(columns=["value", "name"])
+        return execution["result"]
+
+    def get_query_execution(self, QueryExecutionId):
+        self._maybe_throttle("get_query_execution")
+        execution = self.executions[QueryExecutionId]
+        now = time.monotonic()
+        status = {}
+        if now < execution["finishes_at"]:
+            status["State"] = "RUNNING"
+        elif execution["fails"]:
+            status["State"] = "FAILED"
+            status["StateChangeReason"] = "HIVE_CANNOT_OPEN_SPLIT: simulated transient failure"
+            status["AthenaError"] = {"ErrorCategory": 2, "Retryable": True}
+        else:
+            status["State"] = "SUCCEEDED"
+        description = {
+            "QueryExecutionId": QueryExecutionId,
+            "Query": execution["query"],
+            "ResultConfiguration": {"OutputLocation": f"{execution['output_location']}{QueryExecutionId}.csv"},
+            "Status": status,
+        }
+        if status["State"] == "SUCCEEDED":
+            description["Statistics"] = self._statistics(execution)
+        return {"QueryExecution": description}
+
+    def _statistics(self, execution):
+        """
+        Reports a scan of the whole client partition for the day. Queries that do not
+        pin year/month/day scan a month of partitions, so pruning checks have something to find.
+        """
+        partition_bytes = sum(
+            os.path.getsize(os.path.join(self.source_folder, f))
+            for f in os.listdir(self.source_folder) if f.endswith(".parquet")
+        )
+        if not all(re.search(rf"\b{key}\s*=\s*'", execution["query"]) for key in ("year", "month", "day")):
+            partition_bytes *= 30
+        runtime_ms = int(self.latency * 1000)
+        queue_ms = int(self.random.uniform(0, 0.2) * runtime_ms)
+        return {
+            "DataScannedInBytes": partition_bytes,
+            "EngineExecutionTimeInMillis": runtime_ms - queue_ms,
+            "QueryQueueTimeInMillis": queue_ms,
+            "QueryPlanningTimeInMillis": int(runtime_ms * 0.05),
+            "TotalExecutionTimeInMillis": runtime_ms,
+        }
+
+    def get_query_results(self, QueryExecutionId, NextToken=None, MaxResults=1000):
+        self._maybe_throttle("get_query_results")
+        df = self._result(self.executions[QueryExecutionId])
+        start = int(NextToken or 0)
+        size = min(MaxResults, self.page_size)
+        rows = []
+        if start == 0:
+            rows.append({"Data": [{"VarCharValue": column} for column in df.columns]})
+        page = df.iloc[start:start + size]
+        for values in page.itertuples(index=False):
+            rows.append({"Data": [{} if pd.isna(v) else {"VarCharValue": str(v)} for v in values]})
+        response = {"ResultSet": {
+            "Rows": rows,
+            "ResultSetMetadata": {"ColumnInfo": [{"Name": column, "Type": athena_type(df[column])} for column in df.columns]},
+        }}
+        if start + size < len(df):
+            response["NextToken"] = str(start + size)
+        return response
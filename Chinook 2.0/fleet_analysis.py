@@ -0,0 +1,193 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from parquet_reader import read_device
+import openpyxl
+from openpyxl.styles import PatternFill, Font
+from one import get_output_file_name
+from reference_files import read_reference
+
+# Inputs; runs once per client after every device has been processed
+parquet_folder = "parquet"
+devices_list_file = "devices_list.txt"
+date_file = "date.txt"
+limits_files = ["j1939_limit.xlsx", "CDL_limit.xlsx"]
+
+# A device is an outlier for a tag when its robust z-score is at least this large
+outlier_threshold = 3.5
+# Robust z-scores need a few siblings to mean anything
+min_fleet_devices = 3
+
+sheet_name = "Fleet Summary"
+
+
+def limit_tags(files=limits_files):
+    """Returns the tag names of the limits workbooks, the numeric tags the fleet is compared on."""
+    tags = []
+    for limits_file in files:
+        if os.path.exists(limits_file):
+            tags.extend(read_reference(limits_file)["name"].dropna().astype(str))
+    return list(dict.fromkeys(tags))
+
+
+def load_fleet(device_names, tags, folder=parquet_folder):
+    """
+    Reads the numeric samples of every device into one table with dictionary-encoded
+    'device' and 'name' columns and a float 'value' column.
+    Each file is read with only its name and value columns and filtered to the tags before
+    the values are parsed, so the cost follows the number of rows, not devices x tags.
+    """
+    device_dictionary = pa.array(device_names, type=pa.string())
+    tables = []
+    for index, device_name in enumerate(device_names):
+        file_path = os.path.join(folder, f"{device_name}.parquet")
+        if not os.path.exists(file_path):
+            print(f"⚠️ {device_name}: parquet file not found, left out of the fleet.")
+            continue
+        table = read_device(file_path, ["name", "value"], tags=tags)
+        try:
+            values = pc.cast(table.column("value"), pa.float64())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            values = pa.array(pd.to_numeric(table.column("value").to_pandas(), errors="coerce"), type=pa.float64())
+        devices = pa.DictionaryArray.from_arrays(pa.array(np.full(len(table), index, dtype=np.int32)), device_dictionary)
+        tables.append(pa.table({"device": devices, "name": pc.dictionary_encode(table.column("name")).combine_chunks(),
+                                "value": values}))
+    if not tables:
+        return None
+    return pa.concat_tables(tables).unify_dictionaries()
+
+
+def device_tag_means(fleet):
+    """One vectorized group-by over all rows: mean, count, min and max per device and tag."""
+    grouped = fleet.drop_null().group_by(["device", "name"], use_threads=False).aggregate(
+        [("value", "mean"), ("value", "count"), ("value", "min"), ("value", "max")])
+    df = grouped.to_pandas()
+    df["device"] = df["device"].astype(str)
+    df["name"] = df["name"].astype(str)
+    return df.rename(columns={"value_mean": "device_mean", "value_count": "samples",
+                              "value_min": "device_min", "value_max": "device_max"})
+
+
+def rank_outliers(means_df):
+    """
+    Compares every device's mean of a tag with its siblings.
+    z_score uses the fleet mean and standard deviation; robust_z uses the fleet median and
+    the median absolute deviation (scaled by 0.6745), so one broken unit does not hide itself
+    by inflating the spread. When most devices share one mean the MAD is 0, and the mean absolute
+    deviation (scaled by 1.2533) stands in for it, so a single unit away from identical siblings
+    still scores. Tags reported by fewer than min_fleet_devices devices are skipped.
+    :return: (per device and tag DataFrame with the scores, per tag fleet distribution DataFrame)
+    """
+    grouped = means_df.groupby("name")["device_mean"]
+    means_df = means_df.assign(
+        fleet_devices=grouped.transform("size"),
+        fleet_mean=grouped.transform("mean"),
+        fleet_std=grouped.transform(lambda x: x.std(ddof=0)),
+        fleet_median=grouped.transform("median"),
+    )
+    means_df["deviation"] = (means_df["device_mean"] - means_df["fleet_median"]).abs()
+    means_df["fleet_mad"] = means_df.groupby("name")["deviation"].transform("median")
+    means_df["fleet_mean_ad"] = means_df.groupby("name")["deviation"].transform("mean")
+    means_df = means_df[means_df["fleet_devices"] >= min_fleet_devices].copy()
+
+    spread = means_df["fleet_mad"].to_numpy()
+    mean_spread = means_df["fleet_mean_ad"].to_numpy()
+    std = means_df["fleet_std"].to_numpy()
+    signed = (means_df["device_mean"] - means_df["fleet_median"]).to_numpy()
+    robust = np.zeros(len(means_df))
+    np.divide(0.6745 * signed, spread, out=robust, where=spread > 0)
+    np.divide(signed, 1.2533 * mean_spread, out=robust, where=(spread == 0) & (mean_spread > 0))
+    z_score = np.zeros(len(means_df))
+    np.divide((means_df["device_mean"] - means_df["fleet_mean"]).to_numpy(), std, out=z_score, where=std > 0)
+    means_df["robust_z"] = robust
+    means_df["z_score"] = z_score
+
+    distribution = means_df.groupby("name").agg(
+        devices=("device", "size"),
+        fleet_mean=("fleet_mean", "first"),
+        fleet_std=("fleet_std", "first"),
+        fleet_median=("fleet_median", "first"),
+        fleet_mad=("fleet_mad", "first"),
+        fleet_mean_ad=("fleet_mean_ad", "first"),
+        lowest_device_mean=("device_mean", "min"),
+        highest_device_mean=("device_mean", "max"),
+    ).reset_index()
+    return means_df, distribution
+
+
+def device_ranking(scores_df):
+    """Ranks devices by their largest deviation from the fleet, then by how many tags they are outliers for."""
+    scores_df = scores_df.assign(abs_robust_z=scores_df["robust_z"].abs())
+    worst = scores_df.sort_values("abs_robust_z", ascending=False, kind="mergesort").drop_duplicates("device")
+    ranking = scores_df.groupby("device").agg(
+        tags_compared=("name", "size"),
+        outlier_tags=("abs_robust_z", lambda x: int((x >= outlier_threshold).sum())),
+        max_abs_robust_z=("abs_robust_z", "max"),
+    ).reset_index()
+    ranking = ranking.merge(worst[["device", "name"]].rename(columns={"name": "most_deviating_tag"}), on="device")
+    return ranking.sort_values(["max_abs_robust_z", "outlier_tags"], ascending=False, kind="mergesort")
+
+
+def write_summary_sheet(output_file, sections, title=sheet_name):
+    """
+    Writes client-wide sections into their own sheet of the client workbook, right after the
+    cover sheet, replacing the sheet of an earlier run.
+    :param sections: List of (heading, DataFrame) or (heading, DataFrame, fill for the data rows).
+    """
+    workbook = openpyxl.load_workbook(output_file) if os.path.exists(output_file) else openpyxl.Workbook()
+    if title in workbook.sheetnames:
+        del workbook[title]
+    sheet = workbook.create_sheet(title, 1)
+
+    heading_font = Font(size=16, bold=True)
+    light_blue_fill = PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid")
+    row = 1
+    for heading, df, *row_fill in sections:
+        heading_cell = sheet.cell(row=row, column=1, value=heading)
+        heading_cell.font = heading_font
+        heading_cell.fill = light_blue_fill
+        for col_index, column in enumerate(df.columns, start=1):
+            sheet.cell(row=row + 1, column=col_index, value=column).fill = light_blue_fill
+        for row_offset, values in enumerate(df.itertuples(index=False), start=2):
+            for col_index, value in enumerate(values, start=1):
+                cell = sheet.cell(row=row + row_offset, column=col_index, value=None if pd.isna(value) else value)
+                if row_fill:
+                    cell.fill = row_fill[0]
+        row += len(df) + 6
+
+    sheet.column_dimensions["A"].width = 40
+    sheet.column_dimensions["B"].width = 40
+    for column in ["C", "D", "E", "F", "G", "H", "I", "J"]:
+        sheet.column_dimensions[column].width = 18
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    workbook.save(output_file)
+
+
+if __name__ == "__main__":
+    # Step 1: Read the client's devices and the tags to compare
+    with open(devices_list_file, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    device_names = lines[1:]
+    output_file, client, formatted_date = get_output_file_name(devices_list_file, date_file)
+
+    fleet = load_fleet(device_names, limit_tags())
+    if fleet is None or fleet.num_rows == 0:
+        print("No numeric data for the fleet; skipping the fleet summary.")
+    else:
+        # Step 2: Per-device means in one group-by, then fleet distributions and scores per tag
+        scores_df, distribution_df = rank_outliers(device_tag_means(fleet))
+        outliers_df = scores_df[scores_df["robust_z"].abs() >= outlier_threshold]
+        outliers_df = outliers_df.assign(abs_robust_z=outliers_df["robust_z"].abs()).sort_values(
+            "abs_robust_z", ascending=False, kind="mergesort")
+        outliers_df = outliers_df[["name", "device", "device_mean", "fleet_median", "fleet_mad",
+                                   "robust_z", "z_score", "fleet_devices", "samples"]]
+
+        # Step 3: Write the fleet summary sheet into the client workbook
+        write_summary_sheet(output_file, [
+            ("Device Ranking", device_ranking(scores_df).round(3)),
+            ("Fleet Outliers", outliers_df.round(3)),
+            ("Fleet Tag Distribution", distribution_df.round(3)),
+        ])
+        print(f"✅ Fleet summary of {len(device_names)} devices ({fleet.num_rows} samples) saved to: {output_file}")
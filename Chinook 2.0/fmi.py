@@ -1,6 +1,8 @@
 import pandas as pd
 import json
 import os
+from reference_files import read_reference
+from section_spill import read_section, write_section
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 
@@ -11,12 +13,12 @@ output_file = "excel_outputs/FMI-CID.xlsx"  # Output file path
 
 # Ensure the output file is created (even if no data to write)
 empty_df = pd.DataFrame(columns=["CID Description", "FMI Description", "count", "fmi", "cid", "active", "name"])
-empty_df.to_excel(output_file, index=False)
+write_section(empty_df, output_file)  # Also drops the companion of a larger earlier section
 
 try:
     # Step 1: Read the input Excel file
     print("Reading the Excel file...")
-    input_df = pd.read_excel(input_file, sheet_name=None)  # Read all sheets to dynamically handle the sheet
+    input_df = read_section(input_file, sheet_name=None)  # Read all sheets to dynamically handle the sheet
     sheet_name = list(input_df.keys())[0]  # Automatically get the first sheet name
     input_df = input_df[sheet_name]
 
@@ -55,7 +57,7 @@ try:
 
     # Step 4: Read the FMI Source file
     print("Reading the FMI Source data...")
-    fmi_df = pd.read_excel(fmi_source_file, sheet_name="FMI")
+    fmi_df = read_reference(fmi_source_file, sheet_name="FMI")
     fmi_df.columns = fmi_df.columns.str.strip().str.lower()  # Clean column names
     fmi_df['fmi'] = fmi_df['fmi'].apply(lambda x: str(x).replace('\xa0', ' ').strip())  # Clean FMI column
 
@@ -69,7 +71,7 @@ try:
 
     # Step 6: Read the CID descriptions from the "CID" sheet in FMISource
     print("Reading the CID descriptions...")
-    cid_df = pd.read_excel(fmi_source_file, sheet_name="CID")
+    cid_df = read_reference(fmi_source_file, sheet_name="CID")
     cid_df.columns = cid_df.columns.str.strip().str.lower()  # Clean column names
     cid_df['cid'] = cid_df['cid'].apply(lambda x: str(x).replace('\xa0', ' ').strip())  # Clean CID column
 
@@ -86,7 +88,7 @@ try:
 
     # Step 9: Save the parsed DataFrame to a new Excel file
     print("Writing output to Excel...")
-    parsed_df.to_excel(output_file, index=False)
+    write_section(parsed_df, output_file)  # Top rows only beyond the row limit, like the other sections
 
     # Step 10: Adjust column widths and apply color formatting using openpyxl
     print("Adjusting column widths and applying color formatting...")
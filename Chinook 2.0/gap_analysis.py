@@ -0,0 +1,155 @@
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from samples import input_parquet_path, read_samples, limit_thresholds
+
+# Limits workbooks; an optional 'gap_minutes' column sets the silence that counts as a gap per tag
+limits_files = ["j1939_limit.xlsx", "CDL_limit.xlsx"]
+threshold_columns = ["gap_minutes"]
+default_gap_minutes = 10
+
+# Row for the device as a whole: time in which no tag at all was received
+all_tags_name = "(all tags)"
+
+date_file = "date.txt"
+output_file = "excel_outputs/sampling_gaps.xlsx"
+output_columns = ["name", "samples", "samples_per_minute", "median_interval_seconds", "gaps",
+                  "largest_gap_minutes", "largest_gap_start", "minutes_without_data"]
+
+
+def day_bounds(date_file_path=date_file):
+    """Returns the start and end of the queried day in seconds since the epoch, or (None, None)."""
+    try:
+        with open(date_file_path, "r") as f:
+            day = datetime.strptime(f.readline().strip(), "%Y-%m-%d")
+    except (OSError, ValueError):
+        return None, None
+    epoch = datetime(1970, 1, 1)
+    return (day - epoch).total_seconds(), (day + timedelta(days=1) - epoch).total_seconds()
+
+
+def gap_statistics(codes, times, gap_seconds, day_start=None, day_end=None):
+    """
+    Computes sampling statistics for every group of a table sorted by group and time.
+    Intervals are np.diff over the whole table, with the intervals that cross from one group to
+    the next masked out; when the day bounds are known, the silence before the first and after
+    the last sample of a group counts as an interval too.
+    :param codes: Group number of every sample, non-decreasing.
+    :param times: Sample times in seconds, increasing within a group.
+    :param gap_seconds: Silence that counts as a gap, per sample.
+    :return: DataFrame indexed by group number.
+    """
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)] - 1
+    group = codes[starts]
+
+    same_group = codes[1:] == codes[:-1]
+    inner_df = pd.DataFrame({"code": codes[1:][same_group], "start": times[:-1][same_group],
+                             "interval": np.diff(times)[same_group], "gap": gap_seconds[1:][same_group]})
+
+    # Silence at the edges of the day, before the first and after the last sample of each group
+    intervals_df = inner_df
+    if day_start is not None:
+        edges_df = pd.DataFrame({
+            "code": np.r_[group, group],
+            "start": np.r_[np.full(len(group), day_start), times[ends]],
+            "interval": np.r_[times[starts] - day_start, day_end - times[ends]],
+            "gap": np.r_[gap_seconds[starts], gap_seconds[ends]],
+        })
+        intervals_df = pd.concat([inner_df, edges_df], ignore_index=True)
+    gaps_df = intervals_df[intervals_df["interval"] >= intervals_df["gap"]]
+
+    result = pd.DataFrame(index=group)
+    result["samples"] = ends - starts + 1
+    span = times[ends] - times[starts]
+    rate = np.full(len(group), np.nan)
+    np.divide((result["samples"].to_numpy() - 1) * 60.0, span, out=rate, where=span > 0)
+    result["samples_per_minute"] = rate
+    result["median_interval_seconds"] = inner_df.groupby("code")["interval"].median()
+    result["gaps"] = gaps_df.groupby("code").size()
+    result["gaps"] = result["gaps"].fillna(0).astype(int)
+
+    largest = gaps_df.sort_values("interval", ascending=False, kind="mergesort").drop_duplicates("code")
+    largest = largest.set_index("code")
+    result["largest_gap_minutes"] = largest["interval"] / 60
+    result["largest_gap_start"] = largest["start"]
+    result["minutes_without_data"] = gaps_df.groupby("code")["interval"].sum() / 60
+    result["minutes_without_data"] = result["minutes_without_data"].fillna(0)
+    return result
+
+
+def analyze_gaps(samples_df, thresholds, day_start=None, day_end=None, tag_groups=None):
+    """
+    Per-tag sampling rate and gaps for the tags of the limits workbooks, plus one row for the
+    device as a whole over the samples of every tag.
+    :param samples_df: read_samples output.
+    :param thresholds: limit_thresholds output with 'gap_minutes'.
+    :param tag_groups: Tags of every limits workbook. Tags without samples are only listed for the
+        workbooks (protocols) the device sent at least one tag of; None counts all tags as one group.
+    :return: DataFrame with output_columns, the device row first, then the tags without a single
+        sample, then the tags with the most silence.
+    """
+    if samples_df.empty:
+        return pd.DataFrame(columns=output_columns)
+
+    # Device row: every sample of the day in time order
+    all_times = np.sort(samples_df["time"].to_numpy())
+    device = gap_statistics(np.zeros(len(all_times), dtype=np.int64), all_times,
+                            np.full(len(all_times), default_gap_minutes * 60.0), day_start, day_end)
+    device.insert(0, "name", all_tags_name)
+
+    # Tag rows: the limits tags, with their own gap threshold
+    tags_df = samples_df[samples_df["name"].isin(thresholds.index)]
+    tags = pd.DataFrame(columns=device.columns)
+    if not tags_df.empty:
+        categories = tags_df["name"].cat.categories
+        codes = tags_df["name"].cat.codes.to_numpy()
+        gap_seconds = tags_df["name"].map(thresholds["gap_minutes"]).astype(float).to_numpy() * 60
+        tags = gap_statistics(codes, tags_df["time"].to_numpy(), gap_seconds, day_start, day_end)
+        tags.insert(0, "name", categories[tags.index])
+        tags = tags.sort_values(["minutes_without_data", "name"], ascending=[False, True], kind="mergesort")
+
+    # Tags not received at all were silent the whole day
+    day_minutes = (day_end - day_start) / 60 if day_start is not None else 24 * 60.0
+    received = set(tags_df["name"].unique())
+    silent_names = set()
+    for group in (tag_groups if tag_groups is not None else [thresholds.index]):
+        group = set(group) & set(thresholds.index)
+        if group & received:
+            silent_names |= group - received
+    silent_names = sorted(silent_names)
+    silent = pd.DataFrame({"name": silent_names, "samples": 0, "gaps": 1, "largest_gap_minutes": day_minutes,
+                           "largest_gap_start": day_start, "minutes_without_data": day_minutes},
+                          columns=device.columns).astype(device.dtypes.to_dict())
+
+    result = pd.concat([frame for frame in (device, silent, tags) if not frame.empty], ignore_index=True)
+    result["largest_gap_start"] = pd.to_datetime(result["largest_gap_start"], unit="s").dt.strftime("%Y-%m-%d %H:%M:%S")
+    for column in ["samples_per_minute", "median_interval_seconds", "largest_gap_minutes", "minutes_without_data"]:
+        result[column] = result[column].astype(float).round(2)
+    return result[output_columns]
+
+
+if __name__ == "__main__":
+    gaps_df = pd.DataFrame(columns=output_columns)
+    try:
+        # Step 1: Read the per-tag gap thresholds and the device's timestamped samples
+        thresholds = limit_thresholds(limits_files, threshold_columns, [default_gap_minutes])
+        tag_groups = [limit_thresholds([limits_file], threshold_columns, [default_gap_minutes]).index
+                      for limits_file in limits_files if os.path.exists(limits_file)]
+        samples_df = read_samples(input_parquet_path(), with_values=False)
+
+        # Step 2: Sample rate and gaps per tag and for the whole device
+        if samples_df is None:
+            print("⚠️ The parquet file has no timestamp column; sampling gaps cannot be analyzed.")
+        else:
+            day_start, day_end = day_bounds()
+            gaps_df = analyze_gaps(samples_df, thresholds, day_start, day_end, tag_groups)
+            if not gaps_df.empty:
+                print(f"Device without data for {gaps_df['minutes_without_data'].iloc[0]} minutes.")
+    except Exception as e:
+        print(f"❌ Error analyzing sampling gaps: {e}")
+
+    # Step 3: Save, with headers only when there is no data
+    gaps_df.to_excel(output_file, index=False)
+    print(f"✅ Sampling gaps saved to: {output_file}")
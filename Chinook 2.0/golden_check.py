@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+from datetime import datetime
+
+import openpyxl
+
+from benchmark import run_device_chain
+from workdirs import prepare_workdir
+from synthetic_fleet import generate_fleet
+from one import headings
+from limit_rules import limits_sheet_name
+
+# Original per-device stage chain, the reference every candidate chain is checked against
+legacy_device_scripts = [
+    "chinook.py",
+    "Heading.py",
+    "fmi.py",
+    "j1939_stage1.py",
+    "j1939_stage2.py",
+    "j1939_stage3.py",
+    "CDL_stage1.py",
+    "CDL_stage2.py",
+    "CDL_stage3.py",
+    "one.py",
+]
+
+
+def run_engine(workdir, parquet_folder, devices_list_file, query_date, scripts):
+    """
+    Runs a stage chain on a copy of the input parquet files in its own working folder.
+    :return: (path of the client workbook, dictionary of script name to seconds, total seconds)
+    """
+    shutil.rmtree(workdir, ignore_errors=True)
+    prepare_workdir(workdir, query_date)
+    shutil.copytree(parquet_folder, os.path.join(workdir, "parquet"))
+    shutil.copy2(devices_list_file, os.path.join(workdir, "devices_list.txt"))
+
+    with open(devices_list_file, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    start = time.perf_counter()
+    with open(os.path.join(workdir, "golden.log"), "w") as log_file:
+        timings = run_device_chain(workdir, len(lines) - 1, scripts, log_file)
+    total = time.perf_counter() - start
+
+    formatted_date = datetime.strptime(query_date, "%Y-%m-%d").strftime("%Y%m%d")
+    output_file = os.path.join(workdir, "Surprise", f"{lines[0]}_{formatted_date}.xlsx")
+    return output_file, timings, total
+
+
+def read_sections(workbook_path):
+    """
+    Splits every sheet of a client workbook into the sections one.py pasted.
+    :return: Dictionary of (sheet, heading, occurrence) to the list of non-empty rows under the heading.
+    """
+    known_headings = set(headings)
+    workbook = openpyxl.load_workbook(workbook_path, read_only=True, data_only=True)
+    sections = {}
+    for sheet in workbook.worksheets:
+        if sheet.title == limits_sheet_name:
+            continue  # Lookup table of the highlighting rules, not a report section
+        occurrences = {}
+        current = (sheet.title, "(preamble)", 0)
+        sections[current] = []
+        for row in sheet.iter_rows(values_only=True):
+            first = row[0] if row else None
+            if isinstance(first, str) and first in known_headings:
+                occurrences[first] = occurrences.get(first, 0) + 1
+                current = (sheet.title, first, occurrences[first])
+                sections[current] = []
+                continue
+            # Trailing empty cells differ with sheet width, so compare rows without them
+            values = list(row)
+            while values and values[-1] is None:
+                values.pop()
+            if values:
+                sections[current].append(tuple(values))
+    workbook.close()
+    return sections
+
+
+def is_blank(value):
+    """Returns True for empty cells and NaN values."""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def cells_equal(left, right, rel_tol=1e-9):
+    """Compares two cell values, treating numbers within rel_tol and blank/NaN cells as equal."""
+    if is_blank(left) or is_blank(right):
+        return is_blank(left) and is_blank(right)
+    if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+        return math.isclose(left, right, rel_tol=rel_tol, abs_tol=1e-12)
+    return left == right
+
+
+def compare_sections(legacy_sections, candidate_sections, max_examples=5):
+    """
+    Diffs two workbooks section by section.
+    :return: List of difference dictionaries, empty when the workbooks match.
+    """
+    differences = []
+    shared = set(legacy_sections) & set(candidate_sections)
+    legacy_order = [key for key in legacy_sections if key in shared]
+    candidate_order = [key for key in candidate_sections if key in shared]
+    if legacy_order != candidate_order:
+        differences.append({"section": "(workbook)", "issue": "section order"})
+
+    for key in sorted(set(legacy_sections) | set(candidate_sections)):
+        sheet, heading, occurrence = key
+        label = f"{sheet} / {heading} #{occurrence}"
+        if key not in candidate_sections:
+            differences.append({"section": label, "issue": "missing in candidate"})
+            continue
+        if key not in legacy_sections:
+            differences.append({"section": label, "issue": "missing in legacy"})
+            continue
+
+        legacy_rows = legacy_sections[key]
+        candidate_rows = candidate_sections[key]
+        if len(legacy_rows) != len(candidate_rows):
+            differences.append({"section": label, "issue": "row count",
+                                "legacy": len(legacy_rows), "candidate": len(candidate_rows)})
+
+        examples = []
+        for row_index, (legacy_row, candidate_row) in enumerate(zip(legacy_rows, candidate_rows)):
+            width = max(len(legacy_row), len(candidate_row))
+            legacy_row = legacy_row + (None,) * (width - len(legacy_row))
+            candidate_row = candidate_row + (None,) * (width - len(candidate_row))
+            if not all(cells_equal(a, b) for a, b in zip(legacy_row, candidate_row)):
+                examples.append({"row": row_index, "legacy": list(legacy_row), "candidate": list(candidate_row)})
+        if examples:
+            differences.append({"section": label, "issue": "cell values", "mismatched_rows": len(examples),
+                                "examples": examples[:max_examples]})
+    return differences
+
+
+def run_golden_check(base_folder, parquet_folder, devices_list_file, query_date, candidate_scripts,
+                     legacy_scripts=None, report_file=None):
+    """
+    Runs the legacy chain and a candidate chain on the same input and diffs the client workbooks.
+    :return: Report dictionary with timings and differences.
+    """
+    legacy_scripts = legacy_scripts or legacy_device_scripts
+    print("Running legacy chain...")
+    legacy_output, legacy_timings, legacy_total = run_engine(
+        os.path.join(base_folder, "legacy"), parquet_folder, devices_list_file, query_date, legacy_scripts)
+    print("Running candidate chain...")
+    candidate_output, candidate_timings, candidate_total = run_engine(
+        os.path.join(base_folder, "candidate"), parquet_folder, devices_list_file, query_date, candidate_scripts)
+
+    differences = compare_sections(read_sections(legacy_output), read_sections(candidate_output))
+    report = {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "legacy": {"scripts": legacy_scripts, "stages": legacy_timings, "total": round(legacy_total, 3)},
+        "candidate": {"scripts": candidate_scripts, "stages": candidate_timings, "total": round(candidate_total, 3)},
+        "identical": not differences,
+        "differences": differences,
+    }
+    if report_file:
+        with open(report_file, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+    print(f"Legacy: {legacy_total:.1f}s, candidate: {candidate_total:.1f}s")
+    if differences:
+        print(f"❌ {len(differences)} section differences found:")
+        for difference in differences:
+            print(f"  {difference['section']}: {difference['issue']}")
+    else:
+        print("✅ Workbooks are identical")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the legacy and a candidate stage chain on the same input and diff the reports.")
+    parser.add_argument("candidate", nargs="+", help="Stage scripts of the candidate chain, in run order")
+    parser.add_argument("--base-folder", default="golden_runs", help="Folder for the legacy and candidate working folders")
+    parser.add_argument("--parquet-folder", default="parquet", help="Folder with the <device>.parquet input files")
+    parser.add_argument("--devices-list", default="devices_list.txt", help="devices_list.txt matching the parquet files")
+    parser.add_argument("--date", default="2025-01-13", help="Date written to date.txt")
+    parser.add_argument("--synthetic", type=int, metavar="DEVICES",
+                        help="Generate this many synthetic devices instead of using --parquet-folder")
+    parser.add_argument("--rows-per-day", type=int, default=100000, help="Rows per synthetic device")
+    parser.add_argument("--report", help="Write the full JSON report to this file")
+    args = parser.parse_args()
+
+    base_folder = os.path.abspath(args.base_folder)
+    parquet_folder = args.parquet_folder
+    devices_list_file = args.devices_list
+    if args.synthetic:
+        input_folder = os.path.join(base_folder, "input")
+        shutil.rmtree(input_folder, ignore_errors=True)
+        generate_fleet(input_folder, "mop", args.synthetic, args.rows_per_day, day=args.date)
+        parquet_folder = os.path.join(input_folder, "parquet")
+        devices_list_file = os.path.join(input_folder, "devices_list.txt")
+
+    report = run_golden_check(base_folder, os.path.abspath(parquet_folder), os.path.abspath(devices_list_file),
+                              args.date, args.candidate, report_file=args.report)
+    sys.exit(0 if report["identical"] else 1)
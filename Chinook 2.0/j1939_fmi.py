@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.styles import PatternFill
+from reference_files import read_reference
+from section_spill import read_section
+
+# Inputs from chinook.py: DM1/DM2 payloads and J1939 DTC values, with their duplicate counts
+dm_file = "excel_outputs/athena_query_results_DM1_DM2_no_duplicates.xlsx"
+dtc_file = "excel_outputs/athena_query_results_dtc_J1939_with_count.xlsx"
+fmi_source_file = "FMISource.xlsx"  # FMI and SPN sheets
+output_file = "excel_outputs/j1939_fault_codes.xlsx"
+output_columns = ["SPN Description", "FMI Description", "duplicate_count", "spn", "fmi", "occurrence", "lamps", "name"]
+
+# DM1/DM2 start with two lamp status bytes; every DTC after them is 4 bytes
+lamp_bytes = 2
+dtc_bytes = 4
+
+# Lamps of the first status byte, two bits each, highest bits first; a lamp is on when its bits are 01
+lamp_names = ["MIL", "Red Stop", "Amber Warning", "Protect"]
+lamp_lookup = np.array([
+    ", ".join(name for shift, name in zip((6, 4, 2, 0), lamp_names) if (status >> shift) & 0b11 == 1)
+    for status in range(256)
+], dtype=object)
+
+
+def decode_dtcs(buffer, starts):
+    """
+    Decodes the 4-byte J1939 DTCs that start at the given offsets of a byte buffer:
+    SPN is the first two bytes plus the top 3 bits of the third (little-endian, 19 bits),
+    FMI the low 5 bits of the third byte and the occurrence count the low 7 bits of the fourth.
+    """
+    third = buffer[starts + 2].astype(np.int64)
+    spn = buffer[starts].astype(np.int64) | (buffer[starts + 1].astype(np.int64) << 8) | ((third >> 5) << 16)
+    return spn, third & 0x1F, buffer[starts + 3].astype(np.int64) & 0x7F
+
+
+def payload_dtcs(payloads, header_bytes):
+    """
+    Splits hex payloads into their DTCs in one pass over a single byte buffer.
+    :param payloads: Unique payload strings; anything that is not a hex digit is ignored.
+    :param header_bytes: Bytes before the first DTC (lamp_bytes for DM1/DM2, 0 for a bare DTC).
+    :return: DataFrame with one row per DTC: payload (position in payloads), spn, fmi, occurrence, lamps.
+    """
+    cleaned = pd.Series(payloads, dtype=object).astype(str).str.replace(r"[^0-9A-Fa-f]", "", regex=True)
+    counts = np.maximum((cleaned.str.len().to_numpy() // 2 - header_bytes) // dtc_bytes, 0)
+    sizes = np.where(counts > 0, header_bytes + counts * dtc_bytes, 0)
+    buffer = np.frombuffer(b"".join(
+        bytes.fromhex(text[:2 * size]) for text, size in zip(cleaned, sizes)), dtype=np.uint8)
+
+    offsets = np.cumsum(sizes) - sizes
+    payload = np.repeat(np.arange(len(counts)), counts)
+    index_in_payload = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    starts = offsets[payload] + header_bytes + index_in_payload * dtc_bytes
+    spn, fmi, occurrence = decode_dtcs(buffer, starts)
+
+    lamps = lamp_lookup[buffer[offsets[payload]]] if header_bytes else np.full(len(payload), "", dtype=object)
+    dtcs = pd.DataFrame({"payload": payload, "spn": spn, "fmi": fmi, "occurrence": occurrence, "lamps": lamps})
+    # No active fault is sent as an all-zero DTC and unused space as 0xFF padding
+    return dtcs[(dtcs["spn"] != 0x7FFFF) & ~((dtcs["spn"] == 0) & (dtcs["fmi"] == 0))]
+
+
+def dtc_value_payloads(values):
+    """
+    J1939 DTC tag values are the 4 DTC bytes read as one little-endian number; returns them as
+    hex payloads, or the value itself when it is not a number (already a hex string).
+    """
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+    numeric = numbers.notna() & (numbers >= 0) & (numbers < 2 ** 32)
+    payloads = pd.Series(values, dtype=object).astype(str)
+    as_bytes = numbers[numeric].astype(np.int64).to_numpy().astype("<u4").view(np.uint8).reshape(-1, dtc_bytes)
+    payloads[numeric] = [row.tobytes().hex() for row in as_bytes]
+    return payloads.to_numpy()
+
+
+def decode_faults(df, header_bytes, to_payloads=None):
+    """
+    Decodes a (name, value, duplicate_count) table. Every distinct value is decoded once and the
+    DTCs are joined back to the rows, so the work follows the distinct payloads, not the rows.
+    :return: DataFrame with name, duplicate_count, spn, fmi, occurrence, lamps.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["name", "duplicate_count", "spn", "fmi", "occurrence", "lamps"])
+    codes, uniques = pd.factorize(df["value"].astype(str))
+    payloads = to_payloads(uniques) if to_payloads else uniques
+    dtcs = payload_dtcs(payloads, header_bytes)
+    rows = pd.DataFrame({"name": df["name"].to_numpy(), "payload": codes,
+                         "duplicate_count": pd.to_numeric(df["duplicate_count"], errors="coerce").fillna(1).to_numpy()})
+    return rows.merge(dtcs, on="payload").drop(columns="payload")
+
+
+def describe(faults, source_file=fmi_source_file):
+    """Adds SPN and FMI descriptions through indexed lookups on the FMI and SPN sheets of the source file."""
+    sheets = read_reference(source_file, sheet_name=None)
+    lookups = {}
+    for key in ["fmi", "spn"]:
+        sheet = next((df for name, df in sheets.items() if name.strip().lower() == key), None)
+        if sheet is None:
+            print(f"⚠️ No {key.upper()} sheet in {source_file}; {key.upper()} descriptions left out.")
+            lookups[key] = pd.Series(dtype=object)
+            continue
+        sheet.columns = sheet.columns.str.replace("\xa0", " ").str.strip().str.lower()
+        sheet = sheet.dropna(subset=[key])
+        codes = pd.to_numeric(sheet[key].astype(str).str.replace("\xa0", " ").str.strip(), errors="coerce")
+        lookup = pd.Series(sheet["description"].astype(str).str.strip().to_numpy(), index=codes)
+        lookups[key] = lookup[lookup.index.notna() & ~lookup.index.duplicated()]
+    faults["SPN Description"] = faults["spn"].map(lookups["spn"]).fillna("No Description")
+    faults["FMI Description"] = faults["fmi"].map(lookups["fmi"]).fillna("No Description")
+    return faults
+
+
+def read_input(file_path):
+    """Reads a chinook.py output workbook; a missing file counts as no data."""
+    try:
+        df = read_section(file_path)
+    except FileNotFoundError:
+        print(f"⚠️ {file_path} not found.")
+        return pd.DataFrame(columns=["name", "value", "duplicate_count"])
+    return df.dropna(subset=["value"])
+
+
+if __name__ == "__main__":
+    # Ensure the output file is created (even if no data to write)
+    pd.DataFrame(columns=output_columns).to_excel(output_file, index=False)
+
+    try:
+        # Step 1: Decode the DM1/DM2 payloads and the J1939 DTC values, each distinct value once
+        print("Decoding DM1/DM2 payloads and J1939 DTCs...")
+        faults = pd.concat([
+            decode_faults(read_input(dm_file), lamp_bytes),
+            decode_faults(read_input(dtc_file), 0, to_payloads=dtc_value_payloads),
+        ], ignore_index=True)
+
+        # Step 2: One row per tag, SPN and FMI, weighted by how often the payloads were received
+        faults = faults.sort_values("duplicate_count", ascending=False, kind="mergesort")
+        faults = faults.groupby(["name", "spn", "fmi"], as_index=False, sort=False).agg(
+            duplicate_count=("duplicate_count", "sum"),
+            occurrence=("occurrence", "max"),
+            lamps=("lamps", "first"),
+        )
+        faults = faults.sort_values(["duplicate_count", "name"], ascending=[False, True], kind="mergesort")
+
+        # Step 3: Descriptions and save
+        faults = describe(faults)[output_columns]
+        faults["duplicate_count"] = faults["duplicate_count"].astype("int64")
+        faults.to_excel(output_file, index=False)
+
+        # Step 4: Column widths and header color
+        wb = load_workbook(output_file)
+        ws = wb.active
+        for col, width in {"A": 40, "B": 40, "C": 15, "D": 10, "E": 10, "F": 12, "G": 25, "H": 25}.items():
+            ws.column_dimensions[col].width = width
+        light_blue_fill = PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid")
+        for cell in ws[1]:
+            cell.fill = light_blue_fill
+        wb.save(output_file)
+        print(f"✅ {len(faults)} J1939 fault codes saved to: {output_file}")
+
+    except Exception as e:
+        print(f"❌ Error decoding J1939 fault codes: {e}")
@@ -1,4 +1,8 @@
 import pandas as pd
+import pyarrow as pa
+from pair_counts import reduce_pairs
+from reference_files import read_reference
+from section_spill import read_section, cap_section
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 from openpyxl.utils import get_column_letter
@@ -10,8 +14,8 @@ athena_file = "excel_outputs/Format_temp.xlsx"
 j1939_limits_file = "j1939_limit.xlsx"
 
 # Step 1: Read the input and reference Excel files
-aws_df = pd.read_excel(input_file)
-limits_df = pd.read_excel(j1939_limits_file)
+aws_df = read_section(input_file)
+limits_df = read_reference(j1939_limits_file)
 
 # Step 2: Standardize column names
 aws_df.columns = aws_df.columns.str.strip()
@@ -31,8 +35,10 @@ if not duplicates.empty:
     print("Duplicates before combining:")
     print(duplicates)
 
-# Grouping and summing duplicate_count
-aws_df = aws_df.groupby(['name', 'value'], as_index=False)['duplicate_count'].sum()
+# Grouping and summing duplicate_count, sorted by name and value like a pandas groupby
+aws_df = aws_df.dropna(subset=['name'])
+aws_df = reduce_pairs(pa.Table.from_pandas(aws_df[['name', 'value', 'duplicate_count']], preserve_index=False),
+                      counts='duplicate_count').sort_by([('name', 'ascending'), ('value', 'ascending')]).to_pandas()
 
 # Step 5: Reorder columns for output
 aws_df = aws_df[['name', 'value', 'duplicate_count']]
@@ -58,14 +64,7 @@ sheet = workbook.active
 # Define fills for formatting
 blue_fill = PatternFill(start_color="ADD8E6", end_color="ADD8E6", fill_type="solid")
 
-# Step 8: Preserve existing red marks
-existing_fills = {}
-for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=1, max_col=2):  # Only preserve 'name' and 'value' fills
-    for cell in row:
-        if cell.fill.start_color.index != "00000000":  # Check if cell already has a fill
-            existing_fills[(cell.row, cell.column)] = (cell.fill.start_color.index, cell.fill.end_color.index)
-
-# Step 9: Clear and rewrite the sheet with formatted data
+# Step 8: Clear and rewrite the sheet with formatted data
 sheet.delete_rows(2, sheet.max_row)  # Remove all rows except the header
 
 # Write the header
@@ -74,21 +73,13 @@ for col_idx, header_name in enumerate(header, start=1):
     header_cell = sheet.cell(row=1, column=col_idx, value=header_name)
     header_cell.fill = blue_fill  # Apply light blue fill to the header
 
-# Write the new data
-for row_idx, row in enumerate(aws_df.itertuples(index=False), start=2):
+# Write the new data; beyond the row limit every row goes to the companion parquet file and the top rows to the sheet
+for row_idx, row in enumerate(cap_section(aws_df, athena_file).itertuples(index=False), start=2):
     sheet.cell(row=row_idx, column=1, value=row.name)  # Name column
     sheet.cell(row=row_idx, column=2, value=row.value)  # Value column
     sheet.cell(row=row_idx, column=3, value=row.duplicate_count)  # Count column
 
-# Restore preserved red marks
-for (old_row, col), (start_color, end_color) in existing_fills.items():
-    cell_value = sheet.cell(row=old_row, column=col).value
-    for new_row_idx in range(2, sheet.max_row + 1):
-        if sheet.cell(row=new_row_idx, column=col).value == cell_value:
-            sheet.cell(row=new_row_idx, column=col).fill = PatternFill(start_color=start_color, end_color=end_color, fill_type="solid")
-            break
-
-# Step 10: Set column widths
+# Step 9: Set column widths
 column_widths = [35, 15, 15]  # Define column widths for `name`, `value`, and `duplicate_count`
 for idx, width in enumerate(column_widths, start=1):
     column_letter = get_column_letter(idx)
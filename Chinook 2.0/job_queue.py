@@ -0,0 +1,190 @@
+import os
+import shutil
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+from workdirs import prepare_workdir
+from command_runner import CommandRunnerThread
+from stage_timings import format_eta
+
+# Every client runs in its own folder under runs/ (date.txt, devices_list.txt, parquet/, excel_outputs/,
+# stores), so clients can run side by side; the workbook is copied to the top-level Surprise/ as it grows
+runs_folder = "runs"
+report_folder = "Surprise"
+
+# Downloads at once: Athena and the network are shared, a second download only slows the first
+download_limit = 1
+
+
+class Slots:
+    """Counting semaphore whose size can be changed while slots are held."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def set_limit(self, limit):
+        with self.condition:
+            self.limit = limit
+            self.condition.notify_all()
+
+    def __enter__(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.used < self.limit)
+            self.used += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.used -= 1
+            self.condition.notify_all()
+
+
+class ClientJob:
+    """One queued run of a client for a day."""
+
+    def __init__(self, client, query_date, repetitions):
+        self.client = client
+        self.query_date = query_date
+        self.repetitions = repetitions
+        self.workdir = os.path.abspath(os.path.join(runs_folder, client))
+        self.status = "Queued"
+        self.percent = 0
+        self.runner = None
+
+
+class JobQueue(QObject):
+    """
+    Runs queued client jobs. A job downloads while holding a download slot and processes its devices
+    while holding a processing slot, so the download of the next client overlaps the reports of the
+    current one (and, when streaming, a job's own devices are processed while the rest download).
+    At most `parallelism` clients are processed at once; jobs of the same client run one after the
+    other because they share the client's folder.
+    """
+    job_changed = pyqtSignal(int, str, int)  # Job number, status text, percent done
+    job_done = pyqtSignal(int, str)  # Job number, path of the copied workbook
+    report_updated = pyqtSignal(int, str, bool)  # Job number, path of the delivered workbook, whether it is final
+    # Runner threads report through these so completion is handled in the thread of the queue
+    runner_finished = pyqtSignal(int)
+    runner_failed = pyqtSignal(int, str)
+
+    def __init__(self, first_script, remaining_scripts, final_scripts, parallelism=1, worker_address=None,
+                 parquet_folder=None, stream_devices=False):
+        """
+        :param parallelism: Clients processed at once.
+        :param stream_devices: Process every device as soon as the first script saved it (From_AWS.py).
+        :param parquet_folder: Folder with already downloaded device files to link into the job folders,
+                               for a first script that does not download.
+        """
+        super().__init__()
+        self.first_script = first_script
+        self.remaining_scripts = remaining_scripts
+        self.final_scripts = final_scripts
+        self.worker_address = worker_address
+        self.parquet_folder = parquet_folder
+        self.stream_devices = stream_devices
+        self.download_slots = Slots(download_limit)
+        self.processing_slots = Slots(parallelism)
+        self.jobs = []
+        self.runner_finished.connect(self.complete)
+        self.runner_failed.connect(self.fail)
+
+    def set_parallelism(self, parallelism):
+        self.processing_slots.set_limit(parallelism)
+        self.schedule()
+
+    def enqueue(self, client, query_date, repetitions):
+        """Adds a job and starts it when there is room. :return: The job number."""
+        self.jobs.append(ClientJob(client, query_date, repetitions))
+        number = len(self.jobs) - 1
+        self.job_changed.emit(number, "Queued", 0)
+        self.schedule()
+        return number
+
+    def schedule(self):
+        """
+        Starts queued jobs in order: one more than the processing limit may run, so that a job
+        downloads while the others process, and never two jobs of the same client.
+        """
+        running = [job for job in self.jobs if job.status == "Running"]
+        busy_clients = {job.client for job in running}
+        for number, job in enumerate(self.jobs):
+            if len(running) > self.processing_slots.limit:
+                break
+            if job.status != "Queued" or job.client in busy_clients:
+                continue
+            try:
+                self.start(number, job)
+            except Exception as e:
+                job.status = "Failed"
+                self.job_changed.emit(number, f"Failed: {e}", 0)
+                continue
+            running.append(job)
+            busy_clients.add(job.client)
+
+    def start(self, number, job):
+        """Prepares the job folder and starts the job's runner thread."""
+        prepare_workdir(job.workdir, job.query_date)
+        devices_list = os.path.join(job.workdir, "devices_list.txt")
+        shutil.copyfile(f"{job.client}.txt", devices_list)
+        if self.parquet_folder is not None:
+            link_device_files(self.parquet_folder, os.path.join(job.workdir, "parquet"), devices_list)
+
+        job.status = "Running"
+        job.runner = CommandRunnerThread(
+            self.first_script, self.remaining_scripts, job.repetitions, self.final_scripts,
+            worker_address=self.worker_address, workdir=job.workdir,
+            download_slot=self.download_slots, processing_slot=self.processing_slots,
+            stream_devices=self.stream_devices, report_folder=os.path.abspath(report_folder)
+        )
+        job.runner.progress.connect(lambda message: self.job_changed.emit(number, message, job.percent))
+        job.runner.progress_bar_update.connect(lambda percent: setattr(job, "percent", percent))
+        job.runner.stage_started.connect(lambda event: self.job_changed.emit(number, describe_stage(event), event["percent"]))
+        job.runner.report_updated.connect(lambda path, final: self.report_updated.emit(number, path, final))
+        job.runner.finished.connect(lambda: self.runner_finished.emit(number))
+        job.runner.failed.connect(lambda message: self.runner_failed.emit(number, message))
+        job.runner.start()
+
+    def complete(self, number):
+        job = self.jobs[number]
+        job.status = "Done"
+        self.job_changed.emit(number, "Done", 100)
+        self.job_done.emit(number, job.runner.report_file or "")
+        self.schedule()
+
+    def fail(self, number, message):
+        job = self.jobs[number]
+        job.status = "Failed"
+        self.job_changed.emit(number, message, 0)
+        self.schedule()
+
+
+
+def describe_stage(event):
+    """Status text of a stage event, e.g. 'symbotE400588 (3/17) · chinook.py (2/11) · ETA 12 min'."""
+    if event["device"] is not None:
+        where = f"{event['device']} ({event['device_number']}/{event['device_count']}) · "
+    else:
+        where = ""
+    return f"{where}{event['stage']} ({event['stage_number']}/{event['stage_count']}) · ETA {format_eta(event['eta_seconds'])}"
+
+
+def link_device_files(source_folder, target_folder, devices_list):
+    """
+    Makes the device files of a devices list available in a job folder: hard links where the
+    file system allows, copies otherwise.
+    """
+    os.makedirs(target_folder, exist_ok=True)
+    with open(devices_list, "r") as f:
+        devices = [line.strip() for line in f.readlines()[1:] if line.strip()]
+    for device in devices:
+        source = os.path.join(source_folder, f"{device}.parquet")
+        target = os.path.join(target_folder, f"{device}.parquet")
+        if not os.path.exists(source):
+            continue
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
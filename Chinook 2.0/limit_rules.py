@@ -0,0 +1,86 @@
+import os
+import pandas as pd
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook.defined_name import DefinedName
+from reference_files import read_reference
+
+# Hidden sheet of the client workbook with the bounds the highlighting rules look up
+limits_sheet_name = "Limits"
+
+# Limits workbook of each protocol, as stats_engine.py reads them
+limit_files = {
+    "J1939": "j1939_limit.xlsx",
+    "CDL": "CDL_limit.xlsx",
+}
+
+out_of_range_fill = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
+
+
+def tag_bounds(limits_df):
+    """
+    Returns name, min_value and max_value of the tags with both bounds set, the first limits row
+    of a tag winning, like stage2 did.
+    :param limits_df: Limits workbook with 'name', 'min_value' and 'max_value'.
+    """
+    limits = limits_df[['name', 'min_value', 'max_value']].copy()
+    limits['min_value'] = pd.to_numeric(limits['min_value'], errors='coerce')
+    limits['max_value'] = pd.to_numeric(limits['max_value'], errors='coerce')
+    return limits.dropna(subset=['name', 'min_value', 'max_value']).drop_duplicates(subset='name', keep='first')
+
+
+def range_names(protocol):
+    """Defined names of the tag, min and max columns of a protocol in the limits sheet."""
+    return f"{protocol}_limit_names", f"{protocol}_limit_min", f"{protocol}_limit_max"
+
+
+def write_limits_sheet(workbook):
+    """
+    Adds the hidden limits sheet, with a defined name per column, once per workbook.
+    :return: The protocols whose limits are in the workbook.
+    """
+    if limits_sheet_name in workbook.sheetnames:
+        # Keep it behind the device sheets added since
+        sheet = workbook[limits_sheet_name]
+        workbook.move_sheet(sheet, offset=len(workbook.sheetnames) - 1 - workbook.sheetnames.index(limits_sheet_name))
+        return [protocol for protocol in limit_files if range_names(protocol)[0] in workbook.defined_names]
+
+    sheet = workbook.create_sheet(limits_sheet_name)
+    sheet.sheet_state = "hidden"
+    protocols = []
+    for protocol, file_path in limit_files.items():
+        if not os.path.exists(file_path):
+            continue
+        bounds = tag_bounds(read_reference(file_path))
+        first_col = 4 * len(protocols) + 1  # Three columns per protocol and an empty one between
+        for offset, header in enumerate([f"{protocol} name", "min_value", "max_value"]):
+            sheet.cell(row=1, column=first_col + offset, value=header)
+        for row_idx, row in enumerate(bounds.itertuples(index=False), start=2):
+            sheet.cell(row=row_idx, column=first_col, value=row.name)
+            sheet.cell(row=row_idx, column=first_col + 1, value=float(row.min_value))
+            sheet.cell(row=row_idx, column=first_col + 2, value=float(row.max_value))
+
+        last_row = max(2, len(bounds) + 1)
+        for offset, name in enumerate(range_names(protocol)):
+            letter = get_column_letter(first_col + offset)
+            workbook.defined_names[name] = DefinedName(name, attr_text=f"'{limits_sheet_name}'!${letter}$2:${letter}${last_row}")
+        protocols.append(protocol)
+    return protocols
+
+
+def add_limit_rule(sheet, protocol, name_column, value_columns, first_row, last_row):
+    """
+    Highlights the values of rows first_row..last_row that are outside the bounds of the tag in
+    name_column, with one conditional-format rule for the whole block instead of per-cell fills.
+    :param value_columns: Column letters checked against the limits.
+    """
+    if not value_columns or last_row < first_row:
+        return
+    names, min_values, max_values = range_names(protocol)
+    cell = f"{value_columns[0]}{first_row}"
+    position = f"MATCH(${name_column}{first_row},{names},0)"
+    formula = (f"AND(ISNUMBER({cell}),IFERROR(OR({cell}<INDEX({min_values},{position}),"
+               f"{cell}>INDEX({max_values},{position})),FALSE))")
+    cell_range = " ".join(f"{column}{first_row}:{column}{last_row}" for column in value_columns)
+    sheet.conditional_formatting.add(cell_range, FormulaRule(formula=[formula], fill=out_of_range_fill))
@@ -1,7 +1,11 @@
+import os
 import openpyxl
 from openpyxl.styles import PatternFill, Font
 from datetime import datetime
+from section_spill import spilled_rows, export_spill
+from limit_rules import write_limits_sheet, add_limit_rule
 from openpyxl.styles import PatternFill, Font, Alignment
+from openpyxl.utils import get_column_letter
 
 
 def extract_output_sheet_name(input_file):
@@ -37,6 +41,23 @@ def get_output_file_name(devices_list_file, date_file):
     return f"Surprise/{device_name}_{formatted_date}.xlsx", device_name, formatted_date
 
 
+def device_sheet_index(workbook, sheet_name, devices_list_file="devices_list.txt"):
+    """
+    Position for a new device sheet that keeps the sheets in devices_list.txt order, whatever
+    order the devices are processed in: before the first sheet of a device listed after it.
+    :return: The sheet index, or None to add it at the end.
+    """
+    with open(devices_list_file, 'r') as devices_file:
+        device_lines = [line.strip() for line in devices_file.readlines()[1:] if line.strip()]
+    order = {}
+    for number, line in enumerate(device_lines):
+        order.setdefault(line[6:13], number)  # Same part of the name extract_output_sheet_name takes
+    if sheet_name not in order:
+        return None
+    later = [index for index, title in enumerate(workbook.sheetnames) if order.get(title, -1) > order[sheet_name]]
+    return later[0] if later else None
+
+
 def copy_and_paste_excel(file_list, headings, output_sheet_name, output_file, folder_path="excel_outputs", spacing=5):
     """
     Copies content from multiple Excel files, adds custom headings, and pastes them into an output Excel file.
@@ -60,10 +81,13 @@ def copy_and_paste_excel(file_list, headings, output_sheet_name, output_file, fo
 
     # Ensure the output sheet exists
     if output_sheet_name not in output_wb.sheetnames:
-        output_wb.create_sheet(output_sheet_name)
+        output_wb.create_sheet(output_sheet_name, device_sheet_index(output_wb, output_sheet_name))
         print(f"Created output sheet: {output_sheet_name}")
     dest_sheet = output_wb[output_sheet_name]
 
+    # Out-of-range statistics are highlighted by rules that look the bounds up in this sheet
+    limit_protocols = write_limits_sheet(output_wb)
+
 
     # Add date and device name to the first sheet (default sheet)
     first_sheet = output_wb.active
@@ -105,6 +129,10 @@ def copy_and_paste_excel(file_list, headings, output_sheet_name, output_file, fo
     dest_sheet.column_dimensions['D'].width = 20
     dest_sheet.column_dimensions['E'].width = 20
 
+    # Weighted statistics columns of the statistics sections
+    for column in ['F', 'G', 'H', 'I', 'J']:
+        dest_sheet.column_dimensions[column].width = 15
+
     for index, (input_file, heading) in enumerate(zip(file_list, headings), start=1):
         # Create the full path to the input file
         input_file_path = f"{folder_path}/{input_file}"
@@ -139,18 +167,31 @@ def copy_and_paste_excel(file_list, headings, output_sheet_name, output_file, fo
         # Add custom heading with a background color and bold font
         heading_cell = dest_sheet.cell(row=dest_start_row, column=1, value=heading)
 
-        # Set background color based on index (first 7 with red, remaining with light blue)
+        # Set background color: blue for the first section, red for the alert sections, light blue for the rest
         if index == 1:
             heading_cell.fill = blue_fill
-        elif 2 <= index <= 5:
-            heading_cell.fill = red_fill
-        elif 8 <= index <= 12:
+        elif heading in alert_headings:
             heading_cell.fill = red_fill
         else:
             heading_cell.fill = light_blue_fill
 
         heading_cell.font = heading_font  # Apply bold font and increased size
 
+        # A section over the row limit shows its top rows; all rows go to a file next to the workbook
+        overflow_file = os.path.join(os.path.splitext(output_file)[0] + "_overflow",
+                                     f"{output_sheet_name}_{os.path.splitext(input_file)[0]}.csv.gz")
+        total_rows = spilled_rows(input_file_path)
+        if total_rows is not None:
+            export_spill(input_file_path, overflow_file)
+            link = os.path.relpath(overflow_file, os.path.dirname(output_file) or ".").replace(os.sep, "/")
+            note_cell = dest_sheet.cell(row=dest_start_row, column=3,
+                                        value=f"Top {max_row - 1:,} of {total_rows:,} rows; all rows: {link}")
+            note_cell.hyperlink = link
+            note_cell.font = Font(italic=True, color="0000FF", underline="single")
+            print(f"⚠️ {heading}: {total_rows} rows, all of them saved to {overflow_file}")
+        elif os.path.exists(overflow_file):
+            os.remove(overflow_file)
+
         # Copy content from source range to destination sheet
         for row_index, row in enumerate(
             source_sheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col), start=1):
@@ -164,6 +205,14 @@ def copy_and_paste_excel(file_list, headings, output_sheet_name, output_file, fo
         for col_index in range(1, max_col + 1):
             dest_sheet.cell(row=first_data_row, column=col_index).fill = light_blue_fill
 
+        # Statistics outside the limits of their tag, as one rule for the section
+        protocol = limit_sections.get(input_file)
+        if protocol in limit_protocols:
+            header = [cell.value for cell in source_sheet[min_row]][min_col - 1:max_col]
+            value_columns = [get_column_letter(col_index) for col_index, name in enumerate(header, start=1)
+                             if str(name).startswith("value_") and name != "value_std"]
+            add_limit_rule(dest_sheet, protocol, "A", value_columns, first_data_row + 1, dest_start_row + max_row)
+
     # Save the output workbook
     output_wb.save(output_file)
     print(f"Data successfully written to {output_file}")
@@ -181,12 +230,37 @@ file_list = [
     "athena_query_results_dtc_J1939_with_count.xlsx",
     "athena_query_results_error_no_duplicates.xlsx",
     "athena_query_results_DM1_DM2_no_duplicates.xlsx",
+    "j1939_fault_codes.xlsx",
     "athena_query_results_LAMP.xlsx",
     "athena_query_results_OoR_J1939_with_count.xlsx",
     "merged_combined_statistics_ordered_J1939.xlsx",
     "combined_statistics_J1939.xlsx",
+    "stuck_values.xlsx",
+    "sampling_gaps.xlsx",
 ]
 
+# Sections with a red heading: codes, warnings and values out of range, wherever they sit in the list
+alert_headings = {
+    "DTC-CDL",
+    "CDL-Fault-Codes",
+    "CDLWarning",
+    "CDL-Out-of-Range",
+    "DTC-J1939",
+    "Error",
+    "DM1-DM2",
+    "J1939-Fault-Codes",
+    "LAMP",
+    "J1939-Out-of-Range",
+}
+
+# Statistics sections whose values are checked against the limits of their protocol
+limit_sections = {
+    "merged_combined_statistics_ordered_CDL.xlsx": "CDL",
+    "combined_statistics_CDL.xlsx": "CDL",
+    "merged_combined_statistics_ordered_J1939.xlsx": "J1939",
+    "combined_statistics_J1939.xlsx": "J1939",
+}
+
 # Define custom headings for each file
 headings = [
     "SYMX-AI",
@@ -199,22 +273,26 @@ headings = [
     "DTC-J1939",
     "Error",
     "DM1-DM2",
+    "J1939-Fault-Codes",
     "LAMP",
     "J1939-Out-of-Range",
     "Priority J1939 Tags",
     "Combined J1939 Statistics",
+    "Stuck Values",
+    "Sampling Gaps",
 ]
 
-# Define input file paths
-input_file_path = "input_file.txt"  # For extracting sheet name
-devices_list_file = "devices_list.txt"  # For the output file name
-date_file = "date.txt"  # For appending the date to the output file name
+if __name__ == "__main__":
+    # Define input file paths
+    input_file_path = "input_file.txt"  # For extracting sheet name
+    devices_list_file = "devices_list.txt"  # For the output file name
+    date_file = "date.txt"  # For appending the date to the output file name
 
-# Read the output sheet name
-output_sheet_name = extract_output_sheet_name(input_file_path)
+    # Read the output sheet name
+    output_sheet_name = extract_output_sheet_name(input_file_path)
 
-# Generate the output file name and capture device name and formatted date
-output_file, device_name, formatted_date = get_output_file_name(devices_list_file, date_file)
+    # Generate the output file name and capture device name and formatted date
+    output_file, device_name, formatted_date = get_output_file_name(devices_list_file, date_file)
 
-# Run the function
-copy_and_paste_excel(file_list, headings, output_sheet_name, output_file, folder_path="excel_outputs", spacing=5)
+    # Run the function
+    copy_and_paste_excel(file_list, headings, output_sheet_name, output_file, folder_path="excel_outputs", spacing=5)
@@ -0,0 +1,50 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from parquet_reader import open_device
+
+# Rows read per record batch when counting a device file
+batch_rows = 500_000
+
+count_column = "duplicate_count"
+
+
+def reduce_pairs(table, counts=None):
+    """
+    The (name, value) -> duplicate_count reduction as one Arrow hash aggregation.
+    Works on dictionary-encoded names directly and null names or values form their own pairs.
+    The hash table does not keep the input order, so the first row of every pair is aggregated
+    too and the pairs are returned in order of first occurrence; merging a running total with a
+    newer batch therefore keeps the order of the whole file.
+    :param table: pa.Table with 'name' and 'value' columns.
+    :param counts: Column holding counts to add up (for already reduced rows); without it every row counts once.
+    :return: pa.Table with name, value and duplicate_count.
+    """
+    if pa.types.is_dictionary(table.schema.field("name").type):
+        table = table.unify_dictionaries()
+    table = table.append_column("row", pa.array(np.arange(table.num_rows, dtype=np.int64)))
+    aggregation = [(counts, "sum")] if counts else [([], "count_all")]
+    reduced = table.group_by(["name", "value"], use_threads=False).aggregate(aggregation + [("row", "min")])
+    reduced = reduced.sort_by("row_min").drop_columns(["row_min"])
+    return reduced.rename_columns(["name", "value", count_column])
+
+
+def count_pairs(parquet_path, batch_size=batch_rows):
+    """
+    Counts the (name, value) pairs of a device file. Record batches of the two columns are read
+    with the tag names dictionary-encoded, reduced one at a time and merged into a running table,
+    so memory is bounded by one batch plus the distinct pairs.
+    :return: pa.Table with name (string), value and duplicate_count, in order of first occurrence.
+    """
+    parquet_file = open_device(parquet_path)
+    total = None
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=["name", "value"]):
+        reduced = reduce_pairs(pa.Table.from_batches([batch]))
+        total = reduced if total is None else reduce_pairs(pa.concat_tables([total, reduced]), counts=count_column)
+    if total is None:
+        schema = parquet_file.schema_arrow
+        return pa.table({"name": pa.array([], pa.string()), "value": pa.array([], schema.field("value").type),
+                         count_column: pa.array([], pa.int64())})
+    if pa.types.is_dictionary(total.schema.field("name").type):
+        total = total.set_column(0, "name", pc.cast(total.column("name"), pa.string()))
+    return total
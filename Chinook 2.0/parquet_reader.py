@@ -0,0 +1,64 @@
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Columns read as dictionary arrays: a device sends a few hundred tags over millions of rows
+dictionary_columns = ["name"]
+
+
+def open_device(parquet_path, dictionary=True):
+    """
+    Opens a device file memory-mapped. Column chunks are decoded straight from the mapped pages,
+    so a stage that rescans the file a previous stage of the same run read is served from the
+    page cache instead of reading the file into new buffers.
+    :param parquet_path: parquet/<device>.parquet file.
+    :param dictionary: Read the dictionary_columns as dictionary arrays (codes into the distinct tags).
+    :return: pq.ParquetFile
+    """
+    read_dictionary = None
+    if dictionary:
+        names = pq.read_schema(parquet_path, memory_map=True).names
+        read_dictionary = [column for column in dictionary_columns if column in names] or None
+    return pq.ParquetFile(parquet_path, memory_map=True, read_dictionary=read_dictionary)
+
+
+def device_is_empty(parquet_path):
+    """
+    True when a device has no data: no file (its query failed), a file without rows (the
+    device was offline) or a file that cannot be read. Only the footer is read.
+    """
+    if not os.path.exists(parquet_path):
+        return True
+    try:
+        return pq.read_metadata(parquet_path, memory_map=True).num_rows == 0
+    except (OSError, pa.ArrowException):
+        return True
+
+
+def read_device(parquet_path, columns, tags=None, dictionary=True):
+    """
+    Reads only the given columns of a device file as an Arrow table.
+    :param columns: Columns to read; the others are never decoded.
+    :param tags: Keep only the rows of these tag names, all rows when None.
+    :param dictionary: Read the tag names as a dictionary array.
+    :return: pa.Table
+    """
+    table = open_device(parquet_path, dictionary).read(columns=columns)
+    if tags is not None:
+        table = table.filter(tag_rows(table.column("name"), tags))
+    return table
+
+
+def tag_rows(names, tags):
+    """
+    Returns the mask of the rows whose tag is one of `tags`. For a dictionary column the
+    membership test runs once per distinct tag and is gathered through the codes.
+    """
+    value_set = pa.array([str(tag) for tag in tags], type=pa.string())
+    if not pa.types.is_dictionary(names.type):
+        return pc.is_in(names, value_set=value_set).fill_null(False)
+    masks = [pc.take(pc.is_in(chunk.dictionary, value_set=value_set), chunk.indices).fill_null(False)
+             for chunk in names.chunks]
+    return pa.chunked_array(masks, type=pa.bool_())
+
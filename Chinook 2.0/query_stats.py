@@ -0,0 +1,87 @@
+import os
+import re
+import json
+import statistics
+
+# Partition columns of raw."4sight_raw_sensors"; every device query should pin each of them
+partition_keys = ("cust_code", "year", "month", "day")
+
+# Athena's on-demand price per TB scanned, used for the cost estimate in the summary
+price_per_tb = 5.0
+
+run_log_file = "athena_run_log.jsonl"
+
+
+def missing_partition_filters(query):
+    """Returns the partition keys the query does not filter with an equality on a literal."""
+    return [key for key in partition_keys if not re.search(rf"\b{key}\s*=\s*'[^']*'", query)]
+
+
+def execution_statistics(execution):
+    """Pulls the cost and timing figures out of a QueryExecution description."""
+    stats = execution.get("Statistics", {})
+    return {
+        "data_scanned_bytes": stats.get("DataScannedInBytes"),
+        "engine_ms": stats.get("EngineExecutionTimeInMillis"),
+        "queue_ms": stats.get("QueryQueueTimeInMillis"),
+        "planning_ms": stats.get("QueryPlanningTimeInMillis"),
+        "total_ms": stats.get("TotalExecutionTimeInMillis"),
+    }
+
+
+def check_pruning(records, scan_ratio=1.5, max_scan_bytes=None):
+    """
+    Adds warnings to query records that did not prune to the expected partitions.
+    Device is not a partition column, so every device query of one client and day reads the
+    same partitions and should scan about the same bytes. A query that scans far more than the
+    run's median, or more than max_scan_bytes, read partitions it did not need.
+    :param records: Query records with 'query' and 'data_scanned_bytes'; updated in place.
+    :param scan_ratio: Multiple of the median scan that triggers a warning.
+    :param max_scan_bytes: Optional hard ceiling per query.
+    :return: List of warning messages.
+    """
+    warnings = []
+    scanned = [r["data_scanned_bytes"] for r in records if r.get("data_scanned_bytes") is not None]
+    median = statistics.median(scanned) if scanned else None
+
+    for record in records:
+        record_warnings = []
+        missing = missing_partition_filters(record.get("query", ""))
+        if missing:
+            record_warnings.append(f"query does not filter partition columns {', '.join(missing)}")
+        scanned_bytes = record.get("data_scanned_bytes")
+        if scanned_bytes is not None and median and scanned_bytes > median * scan_ratio:
+            record_warnings.append(f"scanned {format_bytes(scanned_bytes)}, {scanned_bytes / median:.1f}x the run median")
+        if scanned_bytes is not None and max_scan_bytes and scanned_bytes > max_scan_bytes:
+            record_warnings.append(f"scanned {format_bytes(scanned_bytes)}, above the {format_bytes(max_scan_bytes)} ceiling")
+        record["warnings"] = record_warnings
+        warnings.extend(f"{record.get('device')}: {message}" for message in record_warnings)
+    return warnings
+
+
+def format_bytes(size):
+    """Formats a byte count for the console."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def summarize(records):
+    """Returns a one-line summary of scanned bytes, estimated cost and queue time for a run."""
+    scanned = sum(r.get("data_scanned_bytes") or 0 for r in records)
+    queue_ms = [r["queue_ms"] for r in records if r.get("queue_ms") is not None]
+    cost = scanned / 1024 ** 4 * price_per_tb
+    longest_queue = f", longest queue {max(queue_ms) / 1000:.1f}s" if queue_ms else ""
+    return f"Scanned {format_bytes(scanned)} in {len(records)} queries (~${cost:.4f}){longest_queue}"
+
+
+def append_run_log(records, log_file=run_log_file):
+    """Appends one JSON line per query record to the run log."""
+    folder = os.path.dirname(log_file)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(log_file, "a") as f:
+        for record in records:
+            f.write(json.dumps(record, default=str) + "\n")
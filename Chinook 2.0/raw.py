@@ -1,5 +1,5 @@
-import pandas as pd
 import os
+from raw_export import export_device
 
 # Define folder paths
 parquet_folder = "parquet"
@@ -19,17 +19,11 @@ parquet_path = os.path.join(parquet_folder, filename)
 if not os.path.isfile(parquet_path):
     print(f"Error: File {filename} not found in {parquet_folder}.")
 else:
-    # Read the Parquet file
-    df = pd.read_parquet(parquet_path)
-
-    # Remove columns that contain the word "RPM" (case-insensitive)
-    df_filtered = df.loc[:, ~df.columns.str.contains("RPM", case=False, na=False)]
-
     # Define output TXT path (tab-separated)
     txt_filename = os.path.splitext(filename)[0] + ".txt"
     txt_path = os.path.join(raw_folder, txt_filename)
 
-    # Save as TXT file (tab-separated)
-    df_filtered.to_csv(txt_path, sep="\t", index=False)
+    # Stream the Parquet file into the TXT file (tab-separated), skipping every RPM tag (case-insensitive)
+    export_device(parquet_path, txt_path, exclude=["RPM"])
 
-    print(f"Converted {filename} to {txt_filename} (excluding 'RPM' columns) and saved in {raw_folder}.")
+    print(f"Converted {filename} to {txt_filename} (excluding 'RPM' tags) and saved in {raw_folder}.")
@@ -0,0 +1,170 @@
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from parquet_reader import open_device
+
+# Define folder paths
+parquet_folder = "parquet"
+raw_folder = "raw"
+devices_list_file = "devices_list.txt"
+
+# File name suffix for every supported output compression
+compression_suffixes = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def open_output(txt_path, compression=None):
+    """Opens the output file, wrapped in a gzip or zstd stream when compression is set."""
+    if compression is None:
+        return pa.OSFile(txt_path, "wb")
+    return pa.CompressedOutputStream(txt_path, compression)
+
+
+def matches_any(names, patterns):
+    """Case-insensitive substring match of a string array against any of the patterns."""
+    mask = pc.match_substring(names, patterns[0], ignore_case=True).fill_null(False)
+    for pattern in patterns[1:]:
+        mask = pc.or_(mask, pc.match_substring(names, pattern, ignore_case=True).fill_null(False))
+    return mask
+
+
+def tag_mask(names, include=None, exclude=None):
+    """
+    Returns the rows to keep for a 'name' column read as a dictionary array. The patterns are
+    evaluated once per distinct tag and the result is gathered through the dictionary indices,
+    so the cost per row is an index lookup rather than a string comparison.
+    """
+    tags = names.dictionary
+    keep = matches_any(tags, include) if include else pa.array([True] * len(tags))
+    if exclude:
+        keep = pc.and_(keep, pc.invert(matches_any(tags, exclude)))
+    return pc.take(keep, names.indices).fill_null(not include)
+
+
+def filtered_batches(parquet_file, columns, batch_size, include=None, exclude=None):
+    """
+    Yields record batches with only the rows whose 'name' passes the include/exclude patterns.
+    The 'name' column is read once per row group; row groups without a matching row are
+    skipped before any other column is decoded, the other columns of the rest are read in batches
+    and sliced against the same names, and excluded rows are dropped on Arrow data before they
+    are converted to Python objects.
+    """
+    other_columns = [column for column in columns if column != "name"]
+    for row_group in range(parquet_file.num_row_groups):
+        names = parquet_file.read_row_group(row_group, columns=["name"]).unify_dictionaries()
+        names = names.column("name").combine_chunks()
+        mask = tag_mask(names, include, exclude)
+        if not pc.any(mask).as_py():
+            continue
+
+        if other_columns:
+            batches = parquet_file.iter_batches(batch_size=batch_size, row_groups=[row_group], columns=other_columns)
+        else:
+            batches = (None for _ in range(0, len(names), batch_size))
+        offset = 0
+        for batch in batches:
+            length = batch.num_rows if batch is not None else min(batch_size, len(names) - offset)
+            keep = mask.slice(offset, length)
+            arrays = {"name": pc.cast(names.slice(offset, length).filter(keep), pa.string())}
+            if batch is not None:
+                batch = batch.filter(keep)
+                arrays.update(zip(batch.schema.names, batch.columns))
+            offset += length
+            if len(arrays["name"]):
+                yield pa.RecordBatch.from_arrays([arrays[column] for column in columns], names=columns)
+
+
+def export_device(parquet_path, txt_path, compression=None, columns=None, batch_size=65536, include=None, exclude=None):
+    """
+    Streams one device's parquet file into a tab-separated text file, one record batch at a time,
+    so memory stays bounded by batch_size rows whatever the size of the device.
+    :param parquet_path: parquet/<device>.parquet file to export.
+    :param txt_path: Output text file.
+    :param compression: None, "gzip" or "zstd".
+    :param columns: Columns to export, all columns when None.
+    :param batch_size: Rows per record batch.
+    :param include: Keep only rows whose tag contains one of these patterns (case-insensitive).
+    :param exclude: Drop rows whose tag contains one of these patterns (case-insensitive).
+    :return: Number of rows written.
+    """
+    parquet_file = open_device(parquet_path, dictionary=bool(include or exclude))
+    columns = columns or parquet_file.schema_arrow.names
+    if include or exclude:
+        batches = filtered_batches(parquet_file, list(dict.fromkeys(columns + ["name"])), batch_size, include, exclude)
+    else:
+        batches = parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+
+    rows = 0
+    with open_output(txt_path, compression) as stream:
+        header = True
+        for batch in batches:
+            batch = batch.select(columns)
+            # Same text layout as the former df.to_csv(sep="\t", index=False) export
+            text = batch.to_pandas().to_csv(sep="\t", index=False, header=header)
+            stream.write(text.encode("utf-8"))
+            header = False
+            rows += batch.num_rows
+        if header:
+            stream.write((("\t".join(columns)) + os.linesep).encode("utf-8"))
+    return rows
+
+
+def raw_output_path(device_name, compression=None, output_folder=raw_folder):
+    """Returns raw/<device>.txt with the suffix of the compression."""
+    return os.path.join(output_folder, f"{device_name}.txt{compression_suffixes[compression]}")
+
+
+def export_client(device_names, compression=None, workers=4, include=None, exclude=None,
+                  input_folder=parquet_folder, output_folder=raw_folder):
+    """
+    Exports every device of a client concurrently, one worker process per device at a time.
+    include/exclude are tag patterns passed on to export_device.
+    :return: (list of exported devices, dictionary of failed device to error message)
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    successes = []
+    failures = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for device_name in device_names:
+            parquet_path = os.path.join(input_folder, f"{device_name}.parquet")
+            if not os.path.isfile(parquet_path):
+                print(f"Error: File {device_name}.parquet not found in {input_folder}.")
+                failures[device_name] = "parquet file not found"
+                continue
+            txt_path = raw_output_path(device_name, compression, output_folder)
+            future = executor.submit(export_device, parquet_path, txt_path, compression, include=include, exclude=exclude)
+            futures[future] = (device_name, txt_path)
+
+        for future in as_completed(futures):
+            device_name, txt_path = futures[future]
+            try:
+                rows = future.result()
+                successes.append(device_name)
+                print(f"Converted {device_name}.parquet to {txt_path} ({rows} rows)")
+            except Exception as e:
+                failures[device_name] = str(e)
+                print(f"Error exporting {device_name}: {e}")
+    return successes, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export every device in devices_list.txt to tab-separated text in raw/.")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], help="Write compressed text files")
+    parser.add_argument("--include", nargs="*", help="Export only tags containing one of these patterns")
+    parser.add_argument("--exclude", nargs="*", default=["RPM"],
+                        help="Skip tags containing one of these patterns (default: RPM; pass --exclude alone to keep all)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Devices exported at once")
+    args = parser.parse_args()
+
+    # First line is the cust_code, the remaining lines are device names
+    with open(devices_list_file, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    successes, failures = export_client(lines[1:], compression=args.compression, workers=args.workers,
+                                        include=args.include, exclude=args.exclude)
+    print(f"\nExported {len(successes)} devices to {raw_folder}.")
+    if failures:
+        print(f"Failed devices: {', '.join(failures)}")
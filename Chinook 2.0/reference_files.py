@@ -0,0 +1,22 @@
+import os
+import pandas as pd
+
+# Parsed reference workbooks (limits, FMISource, Vehicle_details) of this process, keyed by
+# path, read options and file version; a warm worker parses each one once instead of per device
+_cache = {}
+
+
+def read_reference(file_path, **kwargs):
+    """
+    pd.read_excel for reference workbooks, cached per process. A changed file (modification time
+    or size) is read again. Callers get their own copy and may modify it.
+    :return: Same as pd.read_excel(file_path, **kwargs).
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, repr(sorted(kwargs.items())))
+    if key not in _cache:
+        _cache[key] = pd.read_excel(file_path, **kwargs)
+    result = _cache[key]
+    if isinstance(result, dict):
+        return {sheet: df.copy() for sheet, df in result.items()}
+    return result.copy()
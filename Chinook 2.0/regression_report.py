@@ -0,0 +1,125 @@
+import argparse
+import numpy as np
+import pandas as pd
+from openpyxl.styles import PatternFill
+from aggregate_store import load_aggregates, load_events, stored_days
+from fleet_analysis import write_summary_sheet
+from one import get_output_file_name
+
+devices_list_file = "devices_list.txt"
+date_file = "date.txt"
+
+# A tag's daily mean has shifted when it moved this many of the previous day's sample standard
+# deviations; a whole day's mean moving by one spread of the individual samples is a large change
+shift_threshold = 1.0
+# ... and by at least this share of the previous mean, so near-constant tags do not flag on noise
+min_relative_change = 0.1
+
+sheet_name = "Day-over-Day"
+red_fill = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
+
+
+def previous_day(client, day):
+    """Returns the latest day before `day` with stored aggregates, or None."""
+    earlier = [stored for stored in stored_days(client) if stored < day]
+    return earlier[-1] if earlier else None
+
+
+def new_events(today_events, previous_events, previous_devices):
+    """
+    Events of today whose (device, kind, name, code) did not occur on the previous day. Only devices
+    with stored results for the previous day are compared; for the others nothing is known to be new.
+    """
+    keys = ["device", "kind", "name", "code"]
+    today_events = today_events[today_events["device"].isin(previous_devices)]
+    merged = today_events.merge(previous_events[keys].drop_duplicates(), on=keys, how="left", indicator=True)
+    return merged[merged["_merge"] == "left_only"].drop(columns="_merge")
+
+
+def devices_without_previous(today_aggregates, today_events, previous_devices):
+    """Devices with results today but none stored for the previous day (offline, failed download or not stored)."""
+    aggregate_devices = today_aggregates["device"].astype(str)
+    event_devices = today_events["device"].astype(str)
+    devices = pd.DataFrame({"device": pd.concat([aggregate_devices, event_devices]).unique()})
+    devices = devices[~devices["device"].isin(previous_devices)]
+    tags = today_aggregates["name"].groupby(aggregate_devices).nunique().rename("tags_today")
+    events = event_devices.value_counts().rename("events_today")
+    devices = devices.join(tags, on="device").join(events, on="device").fillna(0)
+    return devices.astype({"tags_today": int, "events_today": int}).sort_values("device", kind="mergesort")
+
+
+def statistic_shifts(today, previous):
+    """
+    Joins today's and the previous day's aggregates on device and tag and flags the tags whose
+    mean moved by at least shift_threshold previous-day standard deviations and min_relative_change.
+    :return: (shifted tags DataFrame, tags reported the previous day but not today)
+    """
+    for df in (today, previous):
+        df["mean"] = df["sum"] / df["count"]
+        df["std"] = np.sqrt(np.maximum(df["sumsq"] / df["count"] - df["mean"] ** 2, 0))
+
+    columns = ["device", "name", "count", "mean", "std", "min", "max"]
+    joined = today[columns].merge(previous[columns], on=["device", "name"], how="outer",
+                                  suffixes=("", "_previous"), indicator=True)
+    missing = joined[joined["_merge"] == "right_only"][["device", "name", "count_previous", "mean_previous"]]
+
+    both = joined[joined["_merge"] == "both"].copy()
+    change = (both["mean"] - both["mean_previous"]).to_numpy()
+    spread = both["std_previous"].to_numpy()
+    sigma = np.full(len(both), np.inf)
+    np.divide(np.abs(change), spread, out=sigma, where=spread > 0)
+    sigma[(spread == 0) & (change == 0)] = 0
+    relative = np.abs(change) / np.maximum(np.abs(both["mean_previous"].to_numpy()), 1e-9)
+
+    both["change"] = change
+    both["shift_in_std"] = sigma
+    shifted = both[(sigma >= shift_threshold) & (relative >= min_relative_change)]
+    shifted = shifted.sort_values("shift_in_std", ascending=False, kind="mergesort")
+    shifted = shifted[["device", "name", "mean_previous", "mean", "change", "std_previous", "shift_in_std",
+                       "min_previous", "min", "max_previous", "max", "count_previous", "count"]]
+    shifted["shift_in_std"] = shifted["shift_in_std"].replace(np.inf, np.nan)
+    return shifted, missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the day's results with the previous stored day.")
+    parser.add_argument("--previous", help="Day to compare with (YYYY-MM-DD), default: the latest stored day before")
+    args = parser.parse_args()
+
+    output_file, client, formatted_date = get_output_file_name(devices_list_file, date_file)
+    with open(date_file, "r") as f:
+        day = f.readline().strip()
+    earlier = args.previous or previous_day(client, day)
+
+    if earlier is None:
+        print(f"No stored results for {client} before {day}; nothing to compare with.")
+        write_summary_sheet(output_file, [(f"No stored results before {day} to compare with", pd.DataFrame())],
+                            title=sheet_name)
+    else:
+        # Step 1: Both days from the local store, no download
+        aggregates, _ = load_aggregates(client, earlier, day)
+        events = load_events(client, earlier, day)
+
+        # Step 2: Vectorized joins between the two days, for the devices stored on both
+        today_aggregates = aggregates[aggregates["date"] == day].copy()
+        previous_aggregates = aggregates[aggregates["date"] == earlier].copy()
+        today_events = events[events["date"] == day]
+        previous_events = events[events["date"] == earlier]
+        previous_devices = set(previous_aggregates["device"]) | set(previous_events["device"])
+        shifted, missing = statistic_shifts(today_aggregates, previous_aggregates)
+        added = new_events(today_events, previous_events, previous_devices)
+        no_previous = devices_without_previous(today_aggregates, today_events, previous_devices)
+        added_faults = added[added["kind"].isin(["dtc", "fault"])][["device", "kind", "name", "code", "count"]]
+        added_out_of_range = added[added["kind"] == "out_of_range"][["device", "name", "count"]]
+
+        # Step 3: Day-over-Day sheet, new faults and out-of-range tags highlighted
+        write_summary_sheet(output_file, [
+            (f"New DTCs and Fault Codes since {earlier}", added_faults, red_fill),
+            (f"New Out-of-Range Tags since {earlier}", added_out_of_range, red_fill),
+            (f"Statistic Shifts since {earlier}", shifted.round(3)),
+            (f"Tags Not Reported Since {earlier}", missing),
+            (f"No Previous Data ({earlier}), Not Compared", no_previous),
+        ], title=sheet_name)
+        print(f"✅ Compared {day} with {earlier}: {len(added_faults)} new fault codes, "
+              f"{len(added_out_of_range)} new out-of-range tags, {len(shifted)} shifted tags, "
+              f"{len(no_previous)} devices without previous data. Saved to: {output_file}")
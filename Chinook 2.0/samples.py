@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from parquet_reader import read_device
+from reference_files import read_reference
+
+# Sample time column of the downloaded parquet files (see From_AWS.py)
+timestamp_column = "timestamp"
+
+input_folder = "parquet"
+input_filename_file = "input_file.txt"
+
+
+def input_parquet_path():
+    """Returns parquet/<device>.parquet for the device input.py selected."""
+    with open(input_filename_file, "r") as f:
+        input_file = f.read().strip()
+    if not input_file:
+        raise ValueError("Input filename is empty.")
+    return os.path.join(input_folder, input_file)
+
+
+def to_seconds(times):
+    """
+    Converts a timestamp column to float seconds since the epoch.
+    Accepts datetimes, epoch numbers (milliseconds when too large for seconds) and timestamp strings;
+    unreadable entries become NaN.
+    """
+    if pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.Series(times)
+        seconds = times.dt.tz_localize(None) if times.dt.tz is not None else times
+        return (seconds.astype("datetime64[ns]").astype("int64") / 1e9).where(times.notna()).to_numpy()
+    if pd.api.types.is_numeric_dtype(times):
+        values = pd.to_numeric(pd.Series(times), errors="coerce").to_numpy(dtype=float)
+        return values / 1000 if np.nanmax(values, initial=0) > 1e11 else values
+    return to_seconds(pd.to_datetime(pd.Series(times), errors="coerce", format="mixed"))
+
+
+def read_samples(parquet_path, tags=None, numeric=False, with_values=True):
+    """
+    Reads the timestamped samples of one device, grouped by tag and in time order within a tag.
+    Only the name, value and timestamp columns are read, tag names stay dictionary-encoded and
+    rows of other tags are dropped on the Arrow table before anything is converted to pandas.
+    :param parquet_path: parquet/<device>.parquet file.
+    :param tags: Tag names to keep, all tags when None.
+    :param numeric: Return the values as floats (NaN for non-numeric values) instead of as downloaded.
+    :param with_values: Read the value column; without it only names and times are returned.
+    :return: DataFrame with 'name' (categorical), 'value' and 'time' (seconds since the epoch),
+             or None when the file has no timestamp column.
+    """
+    schema = pq.read_schema(parquet_path, memory_map=True)
+    if timestamp_column not in schema.names:
+        return None
+    columns = ["name", "value", timestamp_column] if with_values else ["name", timestamp_column]
+    table = read_device(parquet_path, columns, tags=tags)
+
+    df = pd.DataFrame({
+        "name": table.column("name").to_pandas(),
+        "time": to_seconds(table.column(timestamp_column).to_pandas()),
+    })
+    if with_values:
+        values = table.column("value")
+        if numeric:
+            try:
+                values = pc.cast(values, pa.float64()).to_numpy()
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                values = pd.to_numeric(values.to_pandas(), errors="coerce").to_numpy(dtype=float)
+        else:
+            values = values.to_pandas()
+        df.insert(1, "value", values)
+    df["name"] = df["name"].astype("category")
+    df = df[df["name"].notna() & df["time"].notna()]
+    order = np.lexsort((df["time"].to_numpy(), df["name"].cat.codes.to_numpy()))
+    return df.iloc[order].reset_index(drop=True)
+
+
+def limit_thresholds(limits_files, columns, defaults):
+    """
+    Reads per-tag thresholds from the limits workbooks. A workbook without a threshold column,
+    or a tag with a blank cell, uses the default for that column.
+    :param limits_files: Limits workbooks (j1939_limit.xlsx, CDL_limit.xlsx).
+    :param columns: Threshold column names.
+    :param defaults: Default value for every column, None for no threshold.
+    :return: DataFrame indexed by tag name with one column per threshold.
+    """
+    frames = []
+    for limits_file in limits_files:
+        if not os.path.exists(limits_file):
+            print(f"Limits file not found: {limits_file}")
+            continue
+        limits_df = read_reference(limits_file)
+        limits_df.columns = limits_df.columns.str.strip()
+        thresholds = pd.DataFrame({"name": limits_df["name"]})
+        for column, default in zip(columns, defaults):
+            default = np.nan if default is None else default
+            if column in limits_df.columns:
+                thresholds[column] = pd.to_numeric(limits_df[column], errors="coerce").fillna(default)
+            else:
+                thresholds[column] = default
+        frames.append(thresholds.dropna(subset=["name"]))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    # First row of a tag wins, as in the limit check
+    return pd.concat(frames).drop_duplicates(subset="name", keep="first").set_index("name")
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Excel stops at 1,048,576 rows per sheet; one.py stacks 17 sections in one device sheet, so every
+# section is capped far below that and the workbook stays a size Excel opens quickly
+excel_row_limit = 1_048_576
+section_row_limit = 50_000
+
+
+def spill_file(xlsx_path):
+    """Companion parquet file that holds every row of a section whose workbook only shows the top rows."""
+    return os.path.splitext(xlsx_path)[0] + ".parquet"
+
+
+def cap_section(df, xlsx_path, sort_by="duplicate_count", row_limit=section_row_limit):
+    """
+    Decides which rows of a section go to its workbook. Up to row_limit rows that is all of them;
+    beyond that every row is saved to the companion parquet file and the workbook gets the top
+    rows (by sort_by, largest first, when the column exists) in the section's own order.
+    A companion left by an earlier, larger section is removed.
+    :return: The rows for the workbook.
+    """
+    companion = spill_file(xlsx_path)
+    if len(df) <= row_limit:
+        if os.path.exists(companion):
+            os.remove(companion)
+        return df
+
+    df.to_parquet(companion, index=False)
+    if sort_by in df.columns:
+        ranked = df[sort_by].reset_index(drop=True).sort_values(ascending=False, kind="mergesort")
+        top = df.iloc[np.sort(ranked.index[:row_limit].to_numpy())]
+    else:
+        top = df.head(row_limit)
+    print(f"⚠️ {os.path.basename(xlsx_path)}: {len(df)} rows, the workbook shows the top {row_limit}; "
+          f"all rows are in {companion}")
+    return top
+
+
+def write_section(df, xlsx_path, sort_by="duplicate_count", row_limit=section_row_limit):
+    """df.to_excel(xlsx_path, index=False) for a section of any size, capped as in cap_section."""
+    top = cap_section(df, xlsx_path, sort_by, row_limit)
+    top.to_excel(xlsx_path, index=False)
+    return top
+
+
+def read_section(xlsx_path, **kwargs):
+    """
+    pd.read_excel(xlsx_path, **kwargs) that returns every row of a section, reading the companion
+    when it spilled (as the only sheet when sheet_name=None asks for all of them).
+    """
+    companion = spill_file(xlsx_path)
+    if os.path.exists(companion):
+        df = pd.read_parquet(companion)
+        return {"Sheet1": df} if "sheet_name" in kwargs and kwargs["sheet_name"] is None else df
+    return pd.read_excel(xlsx_path, **kwargs)
+
+
+def spilled_rows(xlsx_path):
+    """Number of rows of a spilled section, None when the workbook holds all of them."""
+    companion = spill_file(xlsx_path)
+    if not os.path.exists(companion):
+        return None
+    return pq.read_metadata(companion).num_rows
+
+
+def export_spill(xlsx_path, target_file):
+    """Writes every row of a spilled section as gzip-compressed CSV, which opens without Python."""
+    os.makedirs(os.path.dirname(target_file) or ".", exist_ok=True)
+    pd.read_parquet(spill_file(xlsx_path)).to_csv(target_file, index=False, compression="gzip")
+    return target_file
@@ -0,0 +1,87 @@
+import os
+import json
+import threading
+import statistics
+
+# Seconds every stage script took in previous runs, shared by all clients and runs
+timings_file = "stage_timings.json"
+
+# Weight of the newest run in the running average, so timings follow a growing fleet
+smoothing = 0.3
+
+# Stages never timed yet count as this many seconds until other stages give a better guess
+default_seconds = 5.0
+
+_lock = threading.Lock()  # Runners of parallel jobs save to the same file
+
+
+def stage_name(script):
+    return os.path.basename(script).lower()
+
+
+def load_timings(file_path=timings_file):
+    """Returns {stage: expected seconds}; an unreadable or missing file counts as no history."""
+    try:
+        with open(file_path, "r") as f:
+            return {stage: float(seconds) for stage, seconds in json.load(f).items()}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+class StageClock:
+    """
+    Expected durations of the stages of one run, from the timings of previous runs, corrected by
+    how fast this run has been so far. New samples are saved back when the run ends.
+    """
+
+    def __init__(self, file_path=timings_file):
+        self.file_path = file_path
+        self.expected = load_timings(file_path)
+        self.samples = {}
+        self.actual_seconds = 0.0
+        self.expected_seconds = 0.0
+
+    def expect(self, script):
+        """Seconds the stage is expected to take at the usual speed."""
+        stage = stage_name(script)
+        if stage in self.expected:
+            return self.expected[stage]
+        return statistics.median(self.expected.values()) if self.expected else default_seconds
+
+    def record(self, script, seconds):
+        self.samples.setdefault(stage_name(script), []).append(seconds)
+        self.actual_seconds += seconds
+        self.expected_seconds += self.expect(script)
+
+    def speed(self):
+        """Ratio of this run's stage times to the expected ones (above 1 when slower)."""
+        if self.expected_seconds <= 0:
+            return 1.0
+        return self.actual_seconds / self.expected_seconds
+
+    def save(self):
+        """Folds the samples of this run into the timings file."""
+        if not self.samples:
+            return
+        with _lock:
+            timings = load_timings(self.file_path)
+            for stage, seconds in self.samples.items():
+                mean = sum(seconds) / len(seconds)
+                previous = timings.get(stage)
+                timings[stage] = mean if previous is None else (1 - smoothing) * previous + smoothing * mean
+            temporary_file = f"{self.file_path}.tmp"
+            with open(temporary_file, "w") as f:
+                json.dump({stage: round(seconds, 3) for stage, seconds in sorted(timings.items())}, f, indent=2)
+            os.replace(temporary_file, self.file_path)
+        self.samples = {}
+
+
+def format_eta(seconds):
+    """Human readable remaining time, e.g. '45 s', '12 min' or '1 h 05 min'."""
+    seconds = max(0, int(round(seconds)))
+    if seconds < 60:
+        return f"{seconds} s"
+    minutes = (seconds + 30) // 60
+    if minutes < 60:
+        return f"{minutes} min"
+    return f"{minutes // 60} h {minutes % 60:02d} min"
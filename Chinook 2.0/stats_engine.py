@@ -0,0 +1,200 @@
+import os
+import numpy as np
+import pandas as pd
+from reference_files import read_reference
+from section_spill import read_section, write_section
+from limit_rules import tag_bounds
+from aggregate_store import run_identity, save_device_day, device_events, save_device_events
+
+# Percentiles reported for every tag, weighted by how often each value occurred
+percentiles = (5, 50, 95)
+weighted_columns = ['value_wavg', 'value_std'] + [f'value_p{p:02d}' for p in percentiles]
+
+# Columns of the combined and limit-ordered statistics workbooks
+statistics_columns = ['name', 'duplicate_count_sum', 'value_min', 'value_avg', 'value_max'] + weighted_columns
+
+# Inputs and outputs of each protocol; the file names are the ones the stage2/stage3 scripts used
+protocols = {
+    "J1939": {
+        "histogram_file": "excel_outputs/athena_query_results_j1939_no_error_dtc_rpm_with_count.xlsx",
+        "data_file": "excel_outputs/Format_temp.xlsx",
+        "limits_file": "j1939_limit.xlsx",
+        "out_of_bounds_file": "excel_outputs/J1939_out_of_bounds.xlsx",
+        "non_duplicates_file": "excel_outputs/J1939_non_duplicates.xlsx",
+        "combined_file": "excel_outputs/combined_statistics_J1939.xlsx",
+        "merged_file": "excel_outputs/merged_combined_statistics_ordered_J1939.xlsx",
+    },
+    "CDL": {
+        "histogram_file": "excel_outputs/athena_query_results_cdl_no_dtc_error_rpm_cdlecm_with_count.xlsx",
+        "data_file": "excel_outputs/Format_temp-CDL.xlsx",
+        "limits_file": "CDL_limit.xlsx",
+        "out_of_bounds_file": "excel_outputs/CDL_out_of_bounds.xlsx",
+        "non_duplicates_file": "excel_outputs/CDL_non_duplicates_file.xlsx",
+        "combined_file": "excel_outputs/combined_statistics_CDL.xlsx",
+        "merged_file": "excel_outputs/merged_combined_statistics_ordered_CDL.xlsx",
+    },
+}
+
+
+def out_of_bounds_rows(data_df, limits_df):
+    """
+    Returns the (name, value, duplicate_count) rows outside the min/max of their tag.
+    Like stage2, a tag uses the first limits row with both bounds set and tags without
+    limits are never flagged.
+    :param data_df: Stage1 output with 'name', 'value' and 'duplicate_count'.
+    :param limits_df: Limits workbook with 'name', 'min_value' and 'max_value'.
+    """
+    values = pd.to_numeric(data_df['value'], errors='coerce')
+    limits = tag_bounds(limits_df)
+
+    # Align the bounds with the data rows through a name lookup, keeping the data order
+    bounds = limits.set_index('name')
+    min_values = data_df['name'].map(bounds['min_value'])
+    max_values = data_df['name'].map(bounds['max_value'])
+    mask = values.notna() & ((values < min_values) | (values > max_values))
+
+    out_of_bounds = data_df[mask].copy()
+    out_of_bounds['value'] = values[mask]
+    return out_of_bounds
+
+
+def non_duplicate_rows(data_df):
+    """Returns the rows of tags that occur with a single value."""
+    return data_df[~data_df['name'].duplicated(keep=False)]
+
+
+def weighted_statistics(histogram_df):
+    """
+    Computes count-weighted statistics per tag from a (name, value, duplicate_count) histogram,
+    i.e. the statistics of the raw samples without expanding them. Everything is done on the
+    sorted histogram with group sums and cumulative sums, so the cost grows with the number of
+    distinct values rather than the number of samples.
+    Variance is the population variance; a percentile is the smallest value whose cumulative
+    count reaches that share of the tag's samples.
+    :param histogram_df: Table with 'name', 'value' and 'duplicate_count'; non-numeric values are skipped.
+    :return: DataFrame with 'name' and the weighted_columns.
+    """
+    hist = pd.DataFrame({
+        'name': histogram_df['name'],
+        'value': pd.to_numeric(histogram_df['value'], errors='coerce'),
+        'weight': pd.to_numeric(histogram_df['duplicate_count'], errors='coerce'),
+    }).dropna()
+    hist = hist[hist['weight'] > 0]
+    if hist.empty:
+        return pd.DataFrame(columns=['name'] + weighted_columns)
+
+    hist = hist.sort_values(['name', 'value'], kind='mergesort').reset_index(drop=True)
+    groups = hist.groupby('name', sort=False)
+    total = groups['weight'].transform('sum')
+    mean = (hist['value'] * hist['weight']).groupby(hist['name'], sort=False).transform('sum') / total
+
+    # Centre on the tag mean before squaring so large values do not lose precision
+    squared = (hist['weight'] * (hist['value'] - mean) ** 2).groupby(hist['name'], sort=False).sum()
+    first = hist.groupby('name', sort=False).head(1)
+    result = pd.DataFrame({
+        'name': first['name'].values,
+        'value_wavg': mean[first.index].values,
+        'value_std': np.sqrt(squared.values / total[first.index].values),
+    })
+
+    cumulative = groups['weight'].cumsum()
+    for p in percentiles:
+        reached = hist[cumulative >= total * p / 100]
+        result[f'value_p{p:02d}'] = reached.groupby('name', sort=False)['value'].first().values
+    return result
+
+
+def tag_statistics(data_df, histogram_df=None):
+    """
+    Groups the (name, value, duplicate_count) table into one row of statistics per tag.
+    :param data_df: Stage1 output; values rounded and merged per (name, value).
+    :param histogram_df: Unrounded chinook.py output for the weighted columns, data_df when None.
+    """
+    grouped_df = data_df.groupby('name').agg(
+        duplicate_count_sum=('duplicate_count', 'sum'),
+        value_min=('value', 'min'),
+        value_avg=('value', 'mean'),
+        value_max=('value', 'max')
+    ).reset_index()
+    weighted_df = weighted_statistics(data_df if histogram_df is None else histogram_df)
+    grouped_df = pd.merge(grouped_df, weighted_df, on='name', how='left')
+    if grouped_df.empty:
+        grouped_df = pd.DataFrame(columns=statistics_columns)
+    return grouped_df
+
+
+def order_by_limits(grouped_df, limits_df):
+    """Lists the statistics in the order of the limits workbook, with a blank row for tags without data."""
+    merged_df = pd.merge(limits_df[['name']], grouped_df, on='name', how='left')
+    if merged_df.empty:
+        merged_df = pd.DataFrame(columns=statistics_columns)
+    return merged_df
+
+
+def run_protocol(protocol, files):
+    """
+    Reads the stage1 output of one protocol once and writes the out-of-bounds rows, the
+    non-duplicate tags, the combined statistics and the limit-ordered statistics.
+    :param protocol: "J1939" or "CDL", used in the messages.
+    :param files: Entry of the protocols dictionary.
+    :return: The unrounded histogram the weighted statistics were computed from, or None.
+    """
+    if not os.path.exists(files["data_file"]):
+        print(f"{protocol}: data file not found: {files['data_file']}")
+        data_df = pd.DataFrame(columns=['name', 'value', 'duplicate_count'])
+    else:
+        data_df = read_section(files["data_file"])
+
+    if not os.path.exists(files["limits_file"]):
+        print(f"{protocol}: limits file not found: {files['limits_file']}")
+        limits_df = pd.DataFrame(columns=['name', 'min_value', 'max_value'])
+    else:
+        limits_df = read_reference(files["limits_file"])
+
+    histogram_df = None
+    if os.path.exists(files["histogram_file"]):
+        histogram_df = read_section(files["histogram_file"])
+
+    # Step 1: Limit check
+    out_of_bounds_df = out_of_bounds_rows(data_df, limits_df)
+    if out_of_bounds_df.empty:
+        print(f"{protocol}: No out-of-bounds values found.")
+        # Same headerless workbook stage2 wrote when nothing was out of bounds
+        out_of_bounds_df = pd.DataFrame([])
+    write_section(out_of_bounds_df, files["out_of_bounds_file"])
+
+    # Step 2: Tags with a single value
+    write_section(non_duplicate_rows(data_df), files["non_duplicates_file"])
+    print(f"{protocol}: Non-duplicate values saved to: {files['non_duplicates_file']}")
+
+    # Step 3: Statistics per tag, then the same statistics in limits order
+    grouped_df = tag_statistics(data_df, histogram_df)
+    grouped_df.to_excel(files["combined_file"], index=False)
+    print(f"{protocol}: Grouped and statistics data saved to: {files['combined_file']}")
+
+    order_by_limits(grouped_df, limits_df).to_excel(files["merged_file"], index=False)
+    print(f"{protocol}: Merged and ordered data saved to: {files['merged_file']}")
+    return histogram_df
+
+
+if __name__ == "__main__":
+    # Replaces j1939_stage2/3 and CDL_stage2/3; runs after both stage1 scripts
+    histograms = []
+    for protocol, files in protocols.items():
+        try:
+            histogram_df = run_protocol(protocol, files)
+            if histogram_df is not None:
+                histograms.append(histogram_df)
+        except Exception as e:
+            print(f"{protocol}: An error occurred: {e}")
+            for key in ("combined_file", "merged_file"):
+                pd.DataFrame(columns=statistics_columns).to_excel(files[key], index=False)
+
+    # Keep the day's aggregates and events for multi-day statistics and day-over-day reports
+    try:
+        client, day, device = run_identity()
+        if histograms:
+            print(f"Daily aggregates saved to: {save_device_day(client, day, device, histograms)}")
+        print(f"Daily events saved to: {save_device_events(client, day, device, device_events())}")
+    except Exception as e:
+        print(f"⚠️ Could not save the daily aggregates: {e}")
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from samples import input_parquet_path, read_samples, limit_thresholds
+
+# Limits workbooks; optional 'stuck_minutes' and 'stuck_samples' columns set the thresholds per tag
+limits_files = ["j1939_limit.xlsx", "CDL_limit.xlsx"]
+threshold_columns = ["stuck_minutes", "stuck_samples"]
+
+# Used for tags without their own threshold; None disables that check
+default_stuck_minutes = 60
+default_stuck_samples = None
+
+# Two readings of a rarely sent tag say nothing about the sensor, so shorter runs are never reported
+min_run_samples = 3
+
+output_file = "excel_outputs/stuck_values.xlsx"
+output_columns = ["name", "value", "start", "end", "duration_minutes", "samples"]
+
+
+def find_stuck_runs(samples_df, thresholds):
+    """
+    Finds runs of consecutive samples of a tag with the same value that last at least
+    stuck_minutes or span at least stuck_samples samples.
+    Run boundaries come from comparing each sample with the previous one over the whole
+    sorted table at once, so the cost is a few array passes whatever the number of tags.
+    :param samples_df: read_samples output with numeric values.
+    :param thresholds: limit_thresholds output indexed by tag name.
+    :return: DataFrame with output_columns, longest runs first.
+    """
+    samples_df = samples_df[samples_df["name"].isin(thresholds.index) & samples_df["value"].notna()]
+    if samples_df.empty:
+        return pd.DataFrame(columns=output_columns)
+
+    codes = samples_df["name"].cat.codes.to_numpy()
+    names = samples_df["name"].to_numpy()
+    values = samples_df["value"].to_numpy()
+    times = samples_df["time"].to_numpy()
+
+    # A run starts at the first sample of a tag or where the value changes
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = (codes[1:] != codes[:-1]) | (values[1:] != values[:-1])
+    first = np.flatnonzero(starts)
+    last = np.append(first[1:], len(values)) - 1
+
+    runs = pd.DataFrame({
+        "name": names[first],
+        "value": values[first],
+        "start_time": times[first],
+        "end_time": times[last],
+        "samples": last - first + 1,
+    })
+    runs["duration_minutes"] = (runs["end_time"] - runs["start_time"]) / 60
+
+    minutes = runs["name"].map(thresholds["stuck_minutes"])
+    sample_limit = runs["name"].map(thresholds["stuck_samples"])
+    stuck = (runs["duration_minutes"] >= minutes) | (runs["samples"] >= sample_limit)
+    runs = runs[stuck.fillna(False) & (runs["samples"] >= min_run_samples)]
+
+    runs["start"] = pd.to_datetime(runs["start_time"], unit="s").dt.strftime("%Y-%m-%d %H:%M:%S")
+    runs["end"] = pd.to_datetime(runs["end_time"], unit="s").dt.strftime("%Y-%m-%d %H:%M:%S")
+    runs["duration_minutes"] = runs["duration_minutes"].round(1)
+    runs = runs.sort_values(["duration_minutes", "name"], ascending=[False, True], kind="mergesort")
+    return runs[output_columns].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    stuck_df = pd.DataFrame(columns=output_columns)
+    try:
+        # Step 1: Read the per-tag thresholds and the device's timestamped samples
+        thresholds = limit_thresholds(limits_files, threshold_columns, [default_stuck_minutes, default_stuck_samples])
+        samples_df = read_samples(input_parquet_path(), tags=thresholds.index, numeric=True)
+
+        # Step 2: Detect stuck runs
+        if samples_df is None:
+            print("⚠️ The parquet file has no timestamp column; stuck values cannot be detected.")
+        else:
+            stuck_df = find_stuck_runs(samples_df, thresholds)
+            print(f"Found {len(stuck_df)} stuck runs in {len(samples_df)} samples.")
+    except Exception as e:
+        print(f"❌ Error detecting stuck values: {e}")
+
+    # Step 3: Save, with headers only when nothing is stuck
+    stuck_df.to_excel(output_file, index=False)
+    print(f"✅ Stuck values saved to: {output_file}")
@@ -0,0 +1,209 @@
+import os
+import json
+import zlib
+import argparse
+import numpy as np
+import pandas as pd
+
+# Reference files used to draw a realistic tag mix
+j1939_limits_file = "j1939_limit.xlsx"
+cdl_limits_file = "CDL_limit.xlsx"
+
+# Tags that are not in the limits workbooks but show up in every real download
+extra_tags = {
+    "dtc": ["J1939EngineDTC", "J1939TransmissionDTC", "CDLEngineDTC", "CDLChassisDTC"],
+    "oor": ["J1939EngineCoolantTemperatureOoR", "J1939EngineOilPressureOoR", "CDLEngineCoolantTempOoR"],
+    "error": ["J1939CANBusError", "CDLCommunicationError"],
+    "dm": ["J1939DM1", "J1939DM2"],
+    "cdlecm": ["CDLECMActiveFaults", "CDLECMLoggedFaults"],
+    "cdlwarning": ["CDLWarningLevel", "CDLWarningCategory"],
+}
+
+# Share of the daily rows that each tag family gets
+tag_mix = {
+    "j1939": 0.62,
+    "cdl": 0.33,
+    "dtc": 0.01,
+    "oor": 0.005,
+    "error": 0.005,
+    "dm": 0.01,
+    "cdlecm": 0.01,
+    "cdlwarning": 0.01,
+}
+
+
+def load_limit_tags(limits_file, prefix):
+    """
+    Reads a limits workbook and returns (name, min_value, max_value) for every tag that
+    starts with the given prefix. Tags without limits get a 0-255 range.
+    """
+    limits_df = pd.read_excel(limits_file)
+    limits_df.columns = limits_df.columns.str.strip()
+    limits_df = limits_df.dropna(subset=["name"])
+    limits_df = limits_df[limits_df["name"].astype(str).str.startswith(prefix)]
+    limits_df = limits_df.drop_duplicates(subset=["name"])
+    limits_df["min_value"] = pd.to_numeric(limits_df["min_value"], errors="coerce").fillna(0)
+    limits_df["max_value"] = pd.to_numeric(limits_df["max_value"], errors="coerce").fillna(255)
+    return limits_df[["name", "min_value", "max_value"]].reset_index(drop=True)
+
+
+def numeric_values(rng, limits_df, tag_idx, out_of_range_rate):
+    """
+    Draws a value for every row in tag_idx from a normal distribution centred in the
+    tag's limit range. A small share of the rows is pushed outside the range.
+    """
+    low = limits_df["min_value"].to_numpy()[tag_idx]
+    high = limits_df["max_value"].to_numpy()[tag_idx]
+    span = np.maximum(high - low, 1.0)
+    values = rng.normal(loc=low + span / 2, scale=span / 8)
+    values = np.clip(values, low, high)
+
+    # Push some values outside the limits so the out-of-range checks have work to do
+    outside = rng.random(len(tag_idx)) < out_of_range_rate
+    values[outside] = high[outside] + span[outside] * rng.uniform(0.01, 0.5, outside.sum())
+    return np.round(values, 1)
+
+
+def fault_payloads(rng, count):
+    """
+    Builds CDLECM fault payloads in the JSON layout fmi.py parses.
+    A handful of distinct payloads repeat through the day, like on a real machine.
+    """
+    distinct = []
+    for _ in range(8):
+        entries = [
+            {"fmi": int(rng.integers(0, 16)), "cid": int(rng.integers(1, 1500)), "active": bool(rng.random() < 0.5)}
+            for _ in range(int(rng.integers(1, 4)))
+        ]
+        distinct.append(json.dumps(entries))
+    return np.array(distinct, dtype=object)[rng.integers(0, len(distinct), count)]
+
+
+def dm_payloads(rng, count):
+    """
+    Builds DM1/DM2 payloads as hex strings: two lamp status bytes followed by
+    one or more 4-byte SPN/FMI/OC groups.
+    """
+    distinct = []
+    for _ in range(6):
+        payload = bytes([int(rng.integers(0, 256)), 0xFF])
+        for _ in range(int(rng.integers(1, 3))):
+            spn = int(rng.integers(1, 524288))
+            fmi = int(rng.integers(0, 32))
+            occurrence = int(rng.integers(1, 127))
+            payload += bytes([spn & 0xFF, (spn >> 8) & 0xFF, ((spn >> 11) & 0xE0) | fmi, occurrence & 0x7F])
+        distinct.append(payload.hex().upper())
+    return np.array(distinct, dtype=object)[rng.integers(0, len(distinct), count)]
+
+
+def generate_device(device_name, rows_per_day, j1939_df, cdl_df, seed=0, out_of_range_rate=0.002,
+                    day="2025-01-13", stuck_tags=2, dropout_hours=1):
+    """
+    Generates one device's day of data with the same columns From_AWS.py downloads.
+    :param device_name: Name of the device, only used to vary the random stream.
+    :param rows_per_day: Number of rows to generate for the device.
+    :param j1939_df: J1939 tags and limits from load_limit_tags.
+    :param cdl_df: CDL tags and limits from load_limit_tags.
+    :param seed: Base seed so repeated runs produce identical files.
+    :param out_of_range_rate: Share of numeric rows pushed outside their limits.
+    :param day: Day the sample timestamps fall on (YYYY-MM-DD).
+    :param stuck_tags: Number of busy numeric tags frozen at one value for three hours.
+    :param dropout_hours: Length of a window in which the device sends nothing at all.
+    """
+    rng = np.random.default_rng([seed, zlib.crc32(device_name.encode())])  # Serials with the same digits differ too
+    families = list(tag_mix.keys())
+    counts = rng.multinomial(rows_per_day, [tag_mix[f] for f in families])
+
+    names = []
+    values = []
+    for family, count in zip(families, counts):
+        if count == 0:
+            continue
+        if family in ("j1939", "cdl"):
+            limits_df = j1939_df if family == "j1939" else cdl_df
+            # A few chatty tags carry most of the rows, like on the real CAN bus
+            weights = rng.pareto(1.5, len(limits_df)) + 1
+            tag_idx = rng.choice(len(limits_df), size=count, p=weights / weights.sum())
+            names.append(limits_df["name"].to_numpy()[tag_idx])
+            values.append(numeric_values(rng, limits_df, tag_idx, out_of_range_rate).astype(str).astype(object))
+        else:
+            tags = np.array(extra_tags[family], dtype=object)
+            names.append(tags[rng.integers(0, len(tags), count)])
+            if family == "cdlecm":
+                values.append(fault_payloads(rng, count))
+            elif family == "dm":
+                values.append(dm_payloads(rng, count))
+            else:
+                values.append(rng.integers(0, 5, count).astype(str).astype(object))
+
+    df = pd.DataFrame({"value": np.concatenate(values), "name": np.concatenate(names)})
+    # Rows arrive interleaved from Athena, not grouped by tag
+    df = df.sample(frac=1, random_state=int(rng.integers(0, 2**31))).reset_index(drop=True)
+
+    # Sample times spread over the day, in arrival order
+    start = np.datetime64(day, "ms")
+    df["timestamp"] = start + np.sort(rng.integers(0, 86_400_000, len(df))).astype("timedelta64[ms]")
+
+    # Freeze a few busy numeric tags for part of the day, as a stuck sensor would
+    numeric_names = pd.concat([j1939_df["name"], cdl_df["name"]])
+    busy = df["name"][df["name"].isin(numeric_names)].value_counts().index[:20].to_numpy()
+    for name in rng.choice(busy, size=min(stuck_tags, len(busy)), replace=False):
+        window_start = start + np.timedelta64(int(rng.integers(0, 21)), "h")
+        window = ((df["name"] == name) & (df["timestamp"] >= window_start)
+                  & (df["timestamp"] < window_start + np.timedelta64(3, "h")))
+        if window.any():
+            df.loc[window, "value"] = df.loc[window, "value"].iloc[0]
+
+    # The device goes silent once a day, e.g. a lost cellular connection
+    if dropout_hours:
+        silent_start = start + np.timedelta64(int(rng.integers(0, 24 - dropout_hours)), "h")
+        silent = (df["timestamp"] >= silent_start) & (df["timestamp"] < silent_start + np.timedelta64(dropout_hours, "h"))
+        df = df[~silent].reset_index(drop=True)
+    return df
+
+
+def generate_fleet(output_folder, cust_code, device_count, rows_per_day, seed=0, start_serial=400500,
+                   j1939_limits=j1939_limits_file, cdl_limits=cdl_limits_file, day="2025-01-13"):
+    """
+    Writes parquet/<device>.parquet for a synthetic fleet and the matching devices_list.txt.
+    :param output_folder: Working folder; the parquet files go to <output_folder>/parquet.
+    :param cust_code: Client code written as the first line of devices_list.txt.
+    :param device_count: Number of devices to generate.
+    :param rows_per_day: Rows generated for every device.
+    :param seed: Base seed so repeated runs produce identical files.
+    :param start_serial: Serial of the first device (symbotE<serial>).
+    :param j1939_limits: J1939 limits workbook the tag mix is drawn from.
+    :param cdl_limits: CDL limits workbook the tag mix is drawn from.
+    :param day: Day the sample timestamps fall on (YYYY-MM-DD).
+    :return: List of generated device names.
+    """
+    j1939_df = load_limit_tags(j1939_limits, "J1939")
+    cdl_df = load_limit_tags(cdl_limits, "CDL")
+
+    parquet_folder = os.path.join(output_folder, "parquet")
+    os.makedirs(parquet_folder, exist_ok=True)
+
+    device_names = [f"symbotE{start_serial + i}" for i in range(device_count)]
+    for device_name in device_names:
+        df = generate_device(device_name, rows_per_day, j1939_df, cdl_df, seed=seed, day=day)
+        file_path = os.path.join(parquet_folder, f"{device_name}.parquet")
+        df.to_parquet(file_path, index=False, compression="snappy")
+        print(f"Generated {len(df)} rows for {device_name} in {file_path}")
+
+    with open(os.path.join(output_folder, "devices_list.txt"), "w") as f:
+        f.write("\n".join([cust_code] + device_names) + "\n")
+
+    return device_names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic fleet of parquet files for offline runs and benchmarks.")
+    parser.add_argument("output_folder", help="Working folder to write parquet/ and devices_list.txt into")
+    parser.add_argument("--cust-code", default="mop", help="Client code for devices_list.txt")
+    parser.add_argument("--devices", type=int, default=17, help="Number of devices to generate")
+    parser.add_argument("--rows-per-day", type=int, default=100000, help="Rows generated per device")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--date", default="2025-01-13", help="Day of the sample timestamps (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    generate_fleet(args.output_folder, args.cust_code, args.devices, args.rows_per_day, seed=args.seed, day=args.date)
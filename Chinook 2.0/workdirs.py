@@ -0,0 +1,27 @@
+import os
+import shutil
+
+# Folder the pipeline scripts and their reference files live in
+script_folder = os.path.dirname(os.path.abspath(__file__))
+
+# Reference files the stage scripts read from their working folder
+reference_files = [
+    "j1939_limit.xlsx",
+    "CDL_limit.xlsx",
+    "FMISource.xlsx",
+    "Vehicle_details.xlsx",
+]
+
+
+def prepare_workdir(workdir, query_date):
+    """
+    Creates a self-contained working folder with the reference files, date.txt
+    and the output folders the stage scripts expect.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    for file_name in reference_files:
+        shutil.copy2(os.path.join(script_folder, file_name), os.path.join(workdir, file_name))
+    os.makedirs(os.path.join(workdir, "excel_outputs"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "Surprise"), exist_ok=True)
+    with open(os.path.join(workdir, "date.txt"), "w") as f:
+        f.write(query_date)
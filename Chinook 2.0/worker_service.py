@@ -0,0 +1,235 @@
+import os
+import sys
+import time
+import runpy
+import secrets
+import argparse
+import importlib
+import threading
+import traceback
+import subprocess
+from multiprocessing import Pool, AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+# Local address the GUI and the service agree on
+default_address = ("127.0.0.1", 6150)
+
+# Environment variable holding the service's key. start_service generates a random key for every
+# service it starts and hands it only to that service and to its own process, so other local
+# programs cannot connect; connections carry pickled data and run scripts
+authkey_variable = "CHINOOK_WORKER_KEY"
+
+# Libraries the stages import; importing them is most of the start-up time of a cold interpreter
+preloaded_modules = [
+    "numpy", "pandas", "pyarrow", "pyarrow.compute", "pyarrow.parquet", "pyarrow.dataset", "openpyxl",
+    "boto3", "reference_files", "athena_async", "parquet_reader", "pair_counts", "samples",
+]
+
+# A worker process is replaced after this many scripts, so memory a script left behind is returned
+scripts_per_worker = 200
+
+script_folder = os.path.dirname(os.path.abspath(__file__))
+
+
+def warm_up():
+    """Pool initializer: puts the script folder on the import path and imports the libraries once."""
+    if script_folder not in sys.path:
+        sys.path.insert(0, script_folder)
+    for module in preloaded_modules:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"⚠️ Worker could not preload {module}: {e}")
+
+
+def service_key():
+    """Returns the key of the service this process started or was started with, or None."""
+    key = os.environ.get(authkey_variable)
+    return bytes.fromhex(key) if key else None
+
+
+def script_path(script):
+    """
+    Returns the path of a pipeline script in the script folder.
+    :raises ValueError: For any path that resolves outside the script folder.
+    """
+    folder = os.path.realpath(script_folder)
+    path = os.path.realpath(os.path.join(folder, script))
+    if os.path.commonpath([folder, path]) != folder:
+        raise ValueError(f"{script} is not a pipeline script in {script_folder}")
+    return path
+
+
+def run_script(script, args=(), cwd=None):
+    """
+    Runs one pipeline script in this (warm) process the way `python script args` would in cwd:
+    as __main__, with sys.argv set, and sys.exit() turned into an exit code.
+    :return: (exit code, seconds)
+    """
+    start = time.perf_counter()
+    previous_cwd, previous_argv = os.getcwd(), sys.argv
+    code = 0
+    try:
+        path = script_path(script)
+        os.chdir(cwd or previous_cwd)
+        sys.argv = [path] + [str(arg) for arg in args]
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        os.chdir(previous_cwd)
+        sys.argv = previous_argv
+        sys.stdout.flush()
+    return code, time.perf_counter() - start
+
+
+class WorkerService:
+    """
+    Long-lived service that runs pipeline scripts in a pool of warm worker processes.
+    Every connection (one per runner thread) is served by its own thread; its scripts run one
+    at a time, and scripts of different connections run in different worker processes.
+    """
+
+    def __init__(self, address=default_address, workers=2):
+        self.address = address
+        self.workers = workers
+        self.stopping = False
+
+    def serve_forever(self):
+        authkey = service_key()
+        if authkey is None:
+            raise SystemExit(f"❌ {authkey_variable} is not set; start the service with start_service().")
+        with Pool(self.workers, initializer=warm_up, maxtasksperchild=scripts_per_worker) as pool, \
+                Listener(self.address, authkey=authkey) as listener:
+            # Warm every worker before the first job arrives
+            pool.map(time.sleep, [0.1] * self.workers)
+            print(f"✅ Worker service ready on {self.address[0]}:{self.address[1]} with {self.workers} workers")
+            while not self.stopping:
+                try:
+                    connection = listener.accept()
+                except (OSError, AuthenticationError):
+                    continue  # Also a program without the key
+                threading.Thread(target=self.handle, args=(connection, pool), daemon=True).start()
+
+    def handle(self, connection, pool):
+        """Serves the requests of one connection until it is closed."""
+        with connection:
+            while True:
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    return
+                command = request.get("command", "run")
+                if command == "ping":
+                    connection.send({"ok": True})
+                elif command == "stop":
+                    self.stopping = True
+                    connection.send({"ok": True})
+                    # Wake up accept() so serve_forever sees the flag
+                    try:
+                        Client(self.address, authkey=service_key()).close()
+                    except (OSError, AuthenticationError):
+                        pass
+                    return
+                else:
+                    code, seconds = pool.apply(run_script, (request["script"], request.get("args", []), request.get("cwd")))
+                    connection.send({"code": code, "seconds": seconds})
+
+
+class WorkerClient:
+    """
+    Runs pipeline scripts through the worker service, or in a fresh interpreter when the service
+    is not running, with the same result either way. One client per thread.
+    """
+
+    def __init__(self, address=default_address):
+        self.address = address
+        self.connection = None
+        try:
+            if service_key() is None:
+                raise OSError("no service key")
+            self.connection = Client(address, authkey=service_key())
+        except (OSError, AuthenticationError):
+            print("⚠️ Worker service not running; scripts start in new interpreters.")
+
+    def run(self, script, args=(), cwd=None):
+        """
+        Runs a script and waits for it.
+        :return: Seconds the script took.
+        :raises subprocess.CalledProcessError: When the script exits with a non-zero code.
+        :raises ConnectionError: When the service stops before the script finishes.
+        """
+        if self.connection is None:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script_path(script), *map(str, args)], cwd=cwd, check=True)
+            return time.perf_counter() - start
+        try:
+            self.connection.send({"command": "run", "script": script, "args": list(args), "cwd": cwd or os.getcwd()})
+            result = self.connection.recv()
+        except EOFError:
+            self.close()
+            raise ConnectionError(f"Worker service stopped while running {script}")
+        if result["code"] != 0:
+            raise subprocess.CalledProcessError(result["code"], [script, *map(str, args)])
+        return result["seconds"]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def service_running(address=default_address):
+    """Returns True when the worker service of this process's key answers on address."""
+    if service_key() is None:
+        return False
+    try:
+        with Client(address, authkey=service_key()) as connection:
+            connection.send({"command": "ping"})
+            return connection.recv().get("ok", False)
+    except (OSError, EOFError, AuthenticationError):
+        return False
+
+
+def start_service(workers=2, address=default_address, timeout=60):
+    """
+    Starts the worker service in the background with a new random key, unless this process's
+    service is already running, and waits until it accepts connections.
+    :return: The service's subprocess.Popen, or None when it was already running or did not start.
+    """
+    if service_running(address):
+        return None
+    os.environ[authkey_variable] = secrets.token_bytes(32).hex()
+    process = subprocess.Popen([sys.executable, os.path.join(script_folder, "worker_service.py"),
+                                "--workers", str(workers), "--port", str(address[1])], env=dict(os.environ))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        if service_running(address):
+            return process
+        time.sleep(0.2)
+    print("⚠️ Worker service did not start; scripts start in new interpreters.")
+    return None
+
+
+def stop_service(address=default_address):
+    """Asks the running worker service of this process's key to shut down."""
+    if service_key() is None:
+        return
+    try:
+        with Client(address, authkey=service_key()) as connection:
+            connection.send({"command": "stop"})
+            connection.recv()
+    except (OSError, EOFError, AuthenticationError):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep warm Python workers for the pipeline scripts.")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes, i.e. scripts that can run at once")
+    parser.add_argument("--port", type=int, default=default_address[1], help="Local port to listen on")
+    args = parser.parse_args()
+
+    WorkerService((default_address[0], args.port), args.workers).serve_forever()